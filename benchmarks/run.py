@@ -0,0 +1,171 @@
+"""Benchmark contextnodes and vgnuke hot paths without Nuke
+
+The nuke, nukescripts and qtbinding modules are replaced by the in-memory
+stand-ins of the stubs directory.
+
+Example:
+    python benchmarks/run.py --sizes 1000 10000 50000 --output bench.json
+    python benchmarks/run.py --compare bench.json --tolerance 1.5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path[:0] = [
+    os.path.join(BENCHMARKS_DIR, 'stubs'),
+    BENCHMARKS_DIR,
+    ROOT_DIR,
+    os.path.join(ROOT_DIR, 'contextnodes')]
+
+from scene import build_scene  # noqa: E402
+from vgnuke.backdrop import ContentIndex, get_content  # noqa: E402
+from vgnuke.nodetree import (  # noqa: E402
+    GraphSnapshot, get_all_instances, get_parent_nodes)
+from contextnodes.nodes import (  # noqa: E402
+    get_visible_nodes, iter_visible_nodes, switch_visibility)
+from contextnodes.switch import resolve_index  # noqa: E402
+
+DEFAULT_SIZES = (1000, 10000, 50000)
+
+
+def get_content_scan(scene):
+    for backdrop in scene['backdrops']:
+        with backdrop.parent():
+            get_content(backdrop)
+
+
+def get_content_index(scene):
+    index = ContentIndex()
+    for backdrop in scene['backdrops']:
+        get_content(backdrop, index=index)
+
+
+def get_parents(scene):
+    cache = {}
+    for node in scene['nodes'][-100:]:
+        get_parent_nodes(node, cache=cache)
+
+
+def get_parents_from_snapshot(scene):
+    snapshot = GraphSnapshot()
+    for node in scene['nodes'][-100:]:
+        get_parent_nodes(node, snapshot=snapshot)
+
+
+def stream_visible_nodes(scene):
+    for _ in iter_visible_nodes(['Read', 'Write']):
+        pass
+
+
+def resolve_indexes(scene):
+    for switch in scene['switches']:
+        resolve_index(switch)
+
+
+benchmarks = {
+    'get_all_instances': lambda scene: get_all_instances(),
+    'get_content (scan)': get_content_scan,
+    'get_content (index)': get_content_index,
+    'get_visible_nodes': lambda scene: get_visible_nodes(),
+    'iter_visible_nodes (Read, Write)': stream_visible_nodes,
+    'switch_visibility': lambda scene: switch_visibility(),
+    'resolve_index': resolve_indexes,
+    'get_parent_nodes': get_parents,
+    'get_parent_nodes (snapshot)': get_parents_from_snapshot}
+
+
+def measure(function, scene, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(scene)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    function(scene)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    # Blocks allocated by the call and still held once it returned, like
+    # caches, blocks freed during the call are only seen in the peak
+    retained = sum(
+        stat.count_diff for stat in after.compare_to(before, 'filename'))
+    return {
+        'seconds': min(timings),
+        'peak_bytes': peak,
+        'retained_blocks': retained}
+
+
+def run(
+        sizes: list[int],
+        names: list[str] | None = None,
+        repeat: int = 3) -> dict:
+    results = {}
+    for size in sizes:
+        scene = build_scene(size)
+        for name, function in benchmarks.items():
+            if names and name not in names:
+                continue
+            result = measure(function, scene, repeat)
+            results[f'{name} [{size}]'] = result
+            print(
+                f"{name:<34}{size:>8} nodes"
+                f"{result['seconds'] * 1000:>12.2f} ms"
+                f"{result['peak_bytes'] / 1024:>12.1f} KiB peak"
+                f"{result['retained_blocks']:>10} blocks retained",
+                flush=True)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return the benchmarks slower than the baseline times tolerance"""
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        reference = baseline[key]['seconds']
+        if result['seconds'] > reference * tolerance:
+            regressions.append(
+                f"{key}: {result['seconds'] * 1000:.2f} ms "
+                f"(baseline {reference * 1000:.2f} ms)")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+        help='node counts of the synthesized scripts')
+    parser.add_argument(
+        '--only', nargs='+', choices=list(benchmarks), metavar='NAME',
+        help='benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--compare', help='baseline JSON results')
+    parser.add_argument(
+        '--tolerance', type=float, default=1.5,
+        help='allowed slowdown ratio against the baseline')
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.only, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if regressions := compare(results, baseline, args.tolerance):
+            print('Regressions:', *regressions, sep='\n')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
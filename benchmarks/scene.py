@@ -0,0 +1,110 @@
+"""Synthesize scripts in the fake nuke module"""
+
+import json
+import random
+import nuke
+from contextnodes.knobs import CONTEXT_RULES
+from contextnodes.switch import CONTEXT_SWITCH_RULES, CONTEXT_SWITCH_VARIABLE
+
+NODE_CLASSES = ('Blur', 'Grade', 'Merge2', 'Transform', 'Read', 'Write')
+VARIABLES = {
+    'seq': [f'{i:03d}' for i in range(10, 100, 10)],
+    'shot': [f'010_{i:04d}' for i in range(10, 1000, 10)],
+    'department': ['comp', 'light', 'fx']}
+GSV = {'seq': '010', 'shot': '010_0010', 'department': 'comp'}
+
+
+def random_rules(rng: random.Random, count: int) -> str:
+    rules = []
+    for _ in range(count):
+        variable = rng.choice(list(VARIABLES))
+        values = rng.sample(VARIABLES[variable], 3)
+        if rng.random() < 0.3:
+            values[0] = values[0][:-2] + '*'
+        rules.append({
+            'use': True,
+            'context': [variable, ', '.join(values)],
+            'mode': 'exclude' if rng.random() < 0.2 else 'include'})
+    return json.dumps(rules)
+
+
+def add_knob(node, name, value):
+    knob = nuke.String_Knob(name, name, value)
+    node.addKnob(knob)
+
+
+def build_scene(
+        node_count: int,
+        backdrop_count: int | None = None,
+        group_count: int | None = None,
+        rules_per_node: int = 2,
+        ruled_ratio: float = 0.1,
+        switch_count: int | None = None,
+        switch_rules: int = 10,
+        seed: int = 0) -> dict:
+    """Build a new script and return its nodes by kind
+
+    Nodes are spread in the root and nested groups, chained with some
+    additional connections making diamonds."""
+    rng = random.Random(seed)
+    nuke.reset()
+    root = nuke.root()
+    root['gsv'].setValue({'__default__': dict(GSV)})
+    backdrop_count = node_count // 25 if backdrop_count is None else (
+        backdrop_count)
+    group_count = node_count // 500 if group_count is None else group_count
+    switch_count = node_count // 100 if switch_count is None else (
+        switch_count)
+
+    groups = [root]
+    for i in range(group_count):
+        parent = rng.choice(groups)
+        groups.append(nuke.Group('Group', f'Group{i + 1}', parent))
+
+    nodes = []
+    previous = {}
+    for i in range(node_count):
+        group = groups[i % len(groups)]
+        node = nuke.Node(rng.choice(NODE_CLASSES), f'Node{i + 1}', group)
+        node.setXYpos(rng.randint(0, 20000), rng.randint(0, 20000))
+        if (last := previous.get(group)) is not None:
+            node.setInput(0, last)
+            siblings = previous.get((group, 'all'), [])
+            if siblings and rng.random() < 0.3:
+                node.setInput(1, rng.choice(siblings))
+        previous[group] = node
+        previous.setdefault((group, 'all'), []).append(node)
+        if rng.random() < ruled_ratio:
+            add_knob(node, CONTEXT_RULES, random_rules(rng, rules_per_node))
+        nodes.append(node)
+
+    backdrops = []
+    for i in range(backdrop_count):
+        group = groups[i % len(groups)]
+        backdrop = nuke.BackdropNode(
+            'BackdropNode', f'ContextBackdrop{i + 1}', group)
+        backdrop.setXYpos(rng.randint(0, 19000), rng.randint(0, 19000))
+        backdrop['bdwidth'].setValue(rng.randint(200, 1000))
+        backdrop['bdheight'].setValue(rng.randint(200, 1000))
+        add_knob(backdrop, CONTEXT_RULES, random_rules(rng, rules_per_node))
+        backdrops.append(backdrop)
+
+    switches = []
+    for i in range(switch_count):
+        group = groups[i % len(groups)]
+        switch = nuke.Node('Switch', f'ContextSwitch{i + 1}', group)
+        switch.addKnob(nuke.Knob('which', value=0))
+        add_knob(switch, CONTEXT_SWITCH_VARIABLE, 'shot')
+        values = rng.sample(VARIABLES['shot'], switch_rules)
+        rules = [
+            {'index': index, 'value': value}
+            for index, value in enumerate(values)]
+        rules[0]['value'] = '010_*'
+        add_knob(switch, CONTEXT_SWITCH_RULES, json.dumps(rules))
+        switches.append(switch)
+
+    return {
+        'groups': groups[1:],
+        'nodes': nodes,
+        'backdrops': backdrops,
+        'switches': switches}
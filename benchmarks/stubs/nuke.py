@@ -0,0 +1,316 @@
+"""In-memory stand-in of the nuke module used by the benchmarks
+
+Only the API used by contextnodes and vgnuke is implemented. Nodes are plain
+Python objects, there is no evaluation, undo or callback.
+"""
+
+GUI = False
+STARTLINE = 0x1000
+INVISIBLE = 0x400
+DISABLED = 0x80
+
+_root = None
+_context = []
+_this_node = None
+_this_knob = None
+
+
+class Knob:
+    def __init__(self, name: str, label: str = '', value=None):
+        self._name = name
+        self._value = value
+        self._expression = None
+        self._flags = 0
+
+    def name(self):
+        return self._name
+
+    def value(self):
+        return self._value
+
+    def setValue(self, value):  # noqa: N802
+        self._value = value
+        return True
+
+    def setFlag(self, flag):  # noqa: N802
+        self._flags |= flag
+
+    def setExpression(self, expression):  # noqa: N802
+        self._expression = expression
+
+    def hasExpression(self):  # noqa: N802
+        return self._expression is not None
+
+    def clearAnimated(self):  # noqa: N802
+        self._expression = None
+
+    def evaluate(self):
+        return self._value
+
+    def toScript(self):  # noqa: N802
+        return str(self._value)
+
+
+class String_Knob(Knob):  # noqa: N801
+    def __init__(self, name, label='', value=''):
+        super().__init__(name, label, value)
+
+
+Enumeration_Knob = Text_Knob = Int_Knob = Boolean_Knob = String_Knob
+Script_Knob = Radio_Knob = ColorChip_Knob = PyCustom_Knob = String_Knob
+Tab_Knob = File_Knob = String_Knob
+
+
+class Node:
+    default_knobs = (
+        ('xpos', 0), ('ypos', 0), ('selected', False), ('disable', False),
+        ('label', ''), ('autolabel', ''), ('tile_color', 0),
+        ('note_font_size', 11), ('note_font_color', 0))
+
+    def __init__(self, node_class: str, name: str, parent=None):
+        self._class = node_class
+        self._parent = parent
+        self._inputs = []
+        self._dependent = []
+        self._knobs = {}
+        for knob_name, value in self.default_knobs:
+            self._knobs[knob_name] = Knob(knob_name, value=value)
+        self._knobs['name'] = Knob('name', value=name)
+        if parent is not None:
+            parent._children.append(self)
+
+    def __repr__(self):
+        return f'<{self._class} {self.fullName()}>'
+
+    def Class(self):  # noqa: N802
+        return self._class
+
+    def name(self):
+        return self._knobs['name'].value()
+
+    def setName(self, name):  # noqa: N802
+        self._knobs['name'].setValue(name)
+
+    def fullName(self):  # noqa: N802
+        parent = self._parent
+        if parent is None or parent is _root:
+            return self.name()
+        return f'{parent.fullName()}.{self.name()}'
+
+    def parent(self):
+        return self._parent
+
+    def knobs(self):
+        return dict(self._knobs)
+
+    def knob(self, name):
+        return self._knobs.get(name)
+
+    def addKnob(self, knob):  # noqa: N802
+        self._knobs[knob.name()] = knob
+
+    def __getitem__(self, name):
+        return self._knobs[name]
+
+    def xpos(self):
+        return int(self._knobs['xpos'].value())
+
+    def ypos(self):
+        return int(self._knobs['ypos'].value())
+
+    def setXYpos(self, x, y):  # noqa: N802
+        self._knobs['xpos'].setValue(x)
+        self._knobs['ypos'].setValue(y)
+
+    def screenWidth(self):  # noqa: N802
+        return 80
+
+    def screenHeight(self):  # noqa: N802
+        return 18
+
+    def inputs(self):
+        return len(self._inputs)
+
+    def input(self, index):
+        if index < len(self._inputs):
+            return self._inputs[index]
+
+    def setInput(self, index, node):  # noqa: N802
+        while len(self._inputs) <= index:
+            self._inputs.append(None)
+        previous = self._inputs[index]
+        if previous is not None:
+            previous._dependent.remove(self)
+        self._inputs[index] = node
+        if node is not None:
+            node._dependent.append(self)
+        return True
+
+    def dependent(self, *args):
+        return list(self._dependent)
+
+    def channels(self):
+        return []
+
+    def isSelected(self):  # noqa: N802
+        return bool(self._knobs['selected'].value())
+
+    def setSelected(self, selected):  # noqa: N802
+        self._knobs['selected'].setValue(selected)
+
+    def hideControlPanel(self):  # noqa: N802
+        pass
+
+    def showControlPanel(self):  # noqa: N802
+        pass
+
+
+class Group(Node):
+    def __init__(self, node_class: str, name: str, parent=None):
+        self._children = []
+        super().__init__(node_class, name, parent)
+
+    def nodes(self):
+        return list(self._children)
+
+    def begin(self):
+        _context.append(self)
+
+    def end(self):
+        _context.pop()
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, *args):
+        self.end()
+
+
+class Gizmo(Group):
+    pass
+
+
+class BackdropNode(Node):
+    def __init__(self, node_class, name, parent=None):
+        super().__init__(node_class, name, parent)
+        self.addKnob(Knob('bdwidth', value=200))
+        self.addKnob(Knob('bdheight', value=200))
+
+
+class Root(Group):
+    def __init__(self):
+        super().__init__('Root', 'root')
+        self.addKnob(Knob('gsv', value={'__default__': {}}))
+
+
+class Undo:
+    def begin(self, name=''):
+        pass
+
+    def end(self):
+        pass
+
+    def cancel(self):
+        pass
+
+    def disable(self):
+        pass
+
+    def enable(self):
+        pass
+
+
+def reset():
+    """Start from an empty script"""
+    global _root
+    _root = Root()
+    _context.clear()
+
+
+def root():
+    return _root
+
+
+def current_group():
+    return _context[-1] if _context else _root
+
+
+def allNodes(  # noqa: N802
+        filter=None, group=None, recurseGroups=False):  # noqa: A002, N803
+    group = group or current_group()
+    nodes = []
+    stack = [group]
+    while stack:
+        for node in stack.pop().nodes():
+            if filter is None or node.Class() == filter:
+                nodes.append(node)
+            if recurseGroups and isinstance(node, Group):
+                stack.append(node)
+    return nodes
+
+
+def selectedNodes(filter=None):  # noqa: A002, N802
+    return [n for n in allNodes(filter) if n.isSelected()]
+
+
+def toNode(name):  # noqa: N802
+    if name.startswith('root.'):
+        group = _root
+        name = name[len('root.'):]
+    else:
+        group = current_group()
+    node = None
+    for part in name.split('.'):
+        node = next((n for n in group.nodes() if n.name() == part), None)
+        if node is None:
+            return
+        group = node
+    return node
+
+
+def createNode(node_class, knobs='', inpanel=True):  # noqa: N802
+    if node_class == 'BackdropNode':
+        cls = BackdropNode
+    elif node_class in ('Group', 'LiveGroup'):
+        cls = Group
+    else:
+        cls = Node
+    group = current_group()
+    count = sum(1 for n in group.nodes() if n.Class() == node_class)
+    return cls(node_class, f'{node_class}{count + 1}', group)
+
+
+def delete(node):
+    for index in range(node.inputs()):
+        node.setInput(index, None)
+    for dependent in node.dependent():
+        for index in range(dependent.inputs()):
+            if dependent.input(index) is node:
+                dependent.setInput(index, None)
+    node.parent()._children.remove(node)
+
+
+def thisNode():  # noqa: N802
+    return _this_node
+
+
+def thisKnob():  # noqa: N802
+    return _this_knob
+
+
+def activeViewer():  # noqa: N802
+    return None
+
+
+def views():
+    return ['main']
+
+
+class _Nodes:
+    def __getattr__(self, node_class):
+        return lambda **knobs: createNode(node_class, inpanel=False)
+
+
+nodes = _Nodes()
+reset()
@@ -0,0 +1,5 @@
+import nuke
+
+
+def createNodeLocal(node_class, knobs='', inpanel=True):  # noqa: N802
+    return nuke.createNode(node_class, knobs, inpanel=inpanel)
@@ -0,0 +1,11 @@
+"""Stand-in of the Qt binding module used by the benchmarks"""
+
+
+class QTimer:
+    @staticmethod
+    def singleShot(msec, function):  # noqa: N802
+        function()
+
+
+class QtCore:
+    QTimer = QTimer
@@ -0,0 +1,195 @@
+"""Resolve contexts of .nk scripts without Nuke
+
+Example:
+    python -m contextnodes.batch comp/*.nk --variable shot \
+        --values 010_0010 010_0020 --set seq=010 --format csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from vgnuke.spatial import DEFAULT_NODE_SIZE, NodeGrid
+from contextnodes.matching import SwitchTable, compile_rules
+from contextnodes.nkfile import NodeRecord, read_nodes
+
+csv_fields = ('script', 'variable', 'value', 'node', 'class', 'type', 'result')
+
+
+def get_switch_table(raw_rules: str) -> SwitchTable | None:
+    if not raw_rules:
+        return
+    rules = json.loads(raw_rules)
+    # ContextSwitch groups don't store indexes, it is the rule position
+    rules = [
+        {'index': rule.get('index', i), 'value': rule.get('value')}
+        for i, rule in enumerate(rules)]
+    return SwitchTable(rules)
+
+
+def build_grids(nodes: list[NodeRecord]) -> dict[str, NodeGrid]:
+    """Index nodes by position, nodes without stored position are left
+    out"""
+    grids = {}
+    for record in nodes:
+        if record.xpos is None or record.ypos is None:
+            continue
+        grid = grids.setdefault(record.group, NodeGrid())
+        grid.add(record.xpos, record.ypos, *DEFAULT_NODE_SIZE, record)
+    return grids
+
+
+def get_backdrop_content(
+        backdrop: NodeRecord,
+        grids: dict[str, NodeGrid]) -> list[NodeRecord]:
+    """Same logic as vgnuke.backdrop.get_content() in terminal mode"""
+    grid = grids.get(backdrop.group)
+    if grid is None or backdrop.xpos is None or backdrop.ypos is None:
+        return []
+    return grid.query(
+        backdrop.xpos,
+        backdrop.ypos,
+        backdrop.xpos + backdrop.bdwidth,
+        backdrop.ypos + backdrop.bdheight)
+
+
+def resolve_nodes(
+        nodes: list[NodeRecord],
+        gsv_data: dict,
+        grids: dict[str, NodeGrid] | None = None) -> dict:
+    """Same logic as check_assignation_visibility() and resolve_index()
+
+    Nodes inside a disabled context backdrop are reported as hidden, like
+    get_visible_nodes() does."""
+    switches = {}
+    visibility = {}
+    hidden = set()
+    grids = build_grids(nodes) if grids is None else grids
+    for record in nodes:
+        if raw_rules := record.context_rules:
+            enabled = compile_rules(raw_rules)(gsv_data)
+            visibility[record.full_name] = {
+                'class': record.node_class, 'enabled': enabled}
+            if not enabled and record.node_class == 'BackdropNode':
+                hidden.update(
+                    n.full_name
+                    for n in get_backdrop_content(record, grids))
+        variable = record.contextswitch_variable
+        switch_table = get_switch_table(record.contextswitch_rules)
+        if variable and switch_table is not None:
+            test_value = gsv_data.get(variable)
+            switches[record.full_name] = {
+                'class': record.node_class,
+                'index': (
+                    0 if test_value is None
+                    else switch_table.resolve(test_value))}
+    return {
+        'switches': switches, 'nodes': visibility, 'hidden': sorted(hidden)}
+
+
+def resolve_script(
+        path: str,
+        variable: str | None = None,
+        values: list[str] | None = None,
+        gsv_data: dict | None = None) -> list[dict]:
+    """Resolve the script for each value of the variable
+
+    The default graph scope variables stored on Root are the base context,
+    gsv_data and the tested value override them."""
+    nodes = read_nodes(path)
+    grids = build_grids(nodes)
+    root = next(
+        (n for n in nodes if n.node_class == 'Root' and not n.group), None)
+    base_data = root.graph_scope_variables if root is not None else {}
+    gsv_data = {**base_data, **(gsv_data or {})}
+    results = []
+    for value in (values or [None]):
+        context = dict(gsv_data)
+        if variable is not None and value is not None:
+            context[variable] = value
+        result = resolve_nodes(nodes, context, grids)
+        result.update(script=path, variable=variable, value=value)
+        results.append(result)
+    return results
+
+
+def resolve_scripts(
+        paths: list[str],
+        variable: str | None = None,
+        values: list[str] | None = None,
+        gsv_data: dict | None = None,
+        jobs: int | None = None) -> list[dict]:
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(resolve_script, path, variable, values, gsv_data)
+            for path in paths]
+        for future in futures:
+            results.extend(future.result())
+    return results
+
+
+def write_csv(results: list[dict], stream):
+    writer = csv.writer(stream)
+    writer.writerow(csv_fields)
+    for result in results:
+        row = (result['script'], result['variable'], result['value'])
+        for name, data in result['switches'].items():
+            writer.writerow(
+                row + (name, data['class'], 'switch', data['index']))
+        for name, data in result['nodes'].items():
+            writer.writerow(
+                row + (name, data['class'], 'node', int(data['enabled'])))
+        for name in result['hidden']:
+            writer.writerow(row + (name, '', 'hidden', 0))
+
+
+def parse_gsv(items: list[str]) -> dict:
+    gsv_data = {}
+    for item in items:
+        variable, _, value = item.partition('=')
+        gsv_data[variable.strip()] = value.strip()
+    return gsv_data
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description='Resolve context nodes of .nk scripts without Nuke.')
+    parser.add_argument('scripts', nargs='+', help='.nk script files')
+    parser.add_argument('--variable', help='graph scope variable to test')
+    parser.add_argument(
+        '--values', nargs='*', help='values of the variable to test')
+    parser.add_argument(
+        '--set', dest='gsv', action='append', default=[],
+        metavar='VARIABLE=VALUE',
+        help='graph scope variable value, overrides the script default')
+    parser.add_argument('--format', choices=('json', 'csv'), default='json')
+    parser.add_argument('--output', help='report file, stdout by default')
+    parser.add_argument(
+        '--jobs', type=int, default=os.cpu_count(), help='process count')
+    args = parser.parse_args(argv)
+
+    results = resolve_scripts(
+        args.scripts,
+        variable=args.variable,
+        values=args.values,
+        gsv_data=parse_gsv(args.gsv),
+        jobs=args.jobs)
+
+    stream = (
+        open(args.output, 'w', newline='') if args.output else sys.stdout)
+    try:
+        if args.format == 'csv':
+            write_csv(results, stream)
+        else:
+            json.dump(results, stream, indent=2)
+            stream.write('\n')
+    finally:
+        if args.output:
+            stream.close()
+
+
+if __name__ == '__main__':
+    main()
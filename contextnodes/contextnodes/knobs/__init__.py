@@ -7,6 +7,25 @@ CONTEXT_TAGS_KNOB = 'context_tags'
 CONTEXT_RULES = 'context_rules'
 CONTEXT_RULES_PY = 'context_rules_py'
 
+# Flag cache by node, used to exit callbacks early. Nodes are used as keys,
+# not names, so flags follow renamed nodes.
+context_rules_flags: dict[nuke.Node, bool] = {}
+
+
+def has_context_rules(node: nuke.Node) -> bool:
+    flag = context_rules_flags.get(node)
+    if flag is None:
+        flag = node.knob(CONTEXT_RULES) is not None
+        context_rules_flags[node] = flag
+    return flag
+
+
+def forget_context_rules_flag(node: nuke.Node | None = None):
+    if node is None:
+        context_rules_flags.clear()
+    else:
+        context_rules_flags.pop(node, None)
+
 
 def add_custom_rules_knob(node: nuke.Node = None, on_create: bool = False):
     node = node or nuke.thisNode()
@@ -42,5 +61,6 @@ def add_context_knobs(
         rules_knob = create_knob(node, 'STRING', CONTEXT_RULES, 'rules', '')
         rules_knob.setFlag(nuke.INVISIBLE)
         add_custom_rules_knob(node)
+        forget_context_rules_flag(node)
     if node.Class() == 'Root':
         create_knob(node, 'STRING', CONTEXT_TAGS_KNOB, 'tags', '')
@@ -0,0 +1,241 @@
+"""Compiled context rules
+
+Rules stored as JSON in knobs are compiled once into immutable predicates,
+cached on the raw knob string. This module doesn't depend on nuke.
+
+Rule values are comma separated items, each item is either:
+    - a literal value: 010_0010
+    - a glob pattern: 010_*
+    - an inclusive range of numbers: 10-30, matching 10, 0020 or 30
+    - a range of numbers with a step: 10-50:10, matching 10, 20 ... 50
+    - a range sharing a prefix: 010_0010-010_0500:10, matching 010_0010,
+      010_0020 ... 010_0500
+Ranges match values made of their prefix followed by digits, the digits
+are compared as numbers, so padding is ignored. They also match their own
+literal text.
+"""
+
+import fnmatch
+from bisect import bisect_right
+import json
+import os
+import re
+from functools import lru_cache
+
+context_value_separator = ','
+wildcard_characters = ('*', '?', '[')
+compiled_cache_size = 1024
+max_expanded_steps = 4096
+range_re = re.compile(r'(.*?)([0-9]+)-\1([0-9]+)(?::([0-9]+))?')
+numbered_value_re = re.compile(r'(.*?)([0-9]+)')
+
+
+def rule_value_split(rule_value: str) -> list[str]:
+    rule_values = rule_value.split(context_value_separator)
+    return [x.strip() for x in rule_values]
+
+
+def rule_value_join(rule_values: list[str]) -> str:
+    return (context_value_separator + ' ').join(sorted(rule_values))
+
+
+def is_pattern(value: str) -> bool:
+    return any(c in value for c in wildcard_characters)
+
+
+def parse_range(value: str) -> tuple[str, int, int, int] | None:
+    """Return prefix, start, end and step of a range item, None if it isn't
+    one"""
+    if (match := range_re.fullmatch(value)) is None:
+        return
+    prefix, start, end, step = match.groups()
+    return prefix, int(start), int(end), int(step or 1)
+
+
+def merge_intervals(
+        intervals: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class NumberRanges:
+    """Numbers of the ranges sharing a prefix
+
+    Ranges are merged into sorted intervals searched by bisection, small
+    stepped ranges are expanded into a set of numbers.
+    """
+
+    __slots__ = ('starts', 'ends', 'numbers', 'steps')
+
+    def __init__(self, ranges: list[tuple[int, int, int]]):
+        intervals = []
+        numbers = set()
+        steps = []
+        for start, end, step in ranges:
+            if step == 0 or start > end:
+                continue
+            if step == 1:
+                intervals.append((start, end))
+            elif (end - start) // step < max_expanded_steps:
+                numbers.update(range(start, end + 1, step))
+            else:
+                steps.append((start, end, step))
+        intervals = merge_intervals(intervals)
+        self.starts = tuple(start for start, _ in intervals)
+        self.ends = tuple(end for _, end in intervals)
+        self.numbers = frozenset(numbers)
+        self.steps = tuple(steps)
+
+    def __contains__(self, number: int) -> bool:
+        index = bisect_right(self.starts, number) - 1
+        if index >= 0 and number <= self.ends[index]:
+            return True
+        if number in self.numbers:
+            return True
+        return any(
+            start <= number <= end and not (number - start) % step
+            for start, end, step in self.steps)
+
+
+class ValueMatcher:
+    """Match a value against a list of rule values
+
+    Values without wildcard are tested in a set, the other ones are merged
+    in a single regular expression, same result as fnmatch.fnmatch()
+    against each rule value. Ranges are grouped by prefix, a value is split
+    into its prefix and trailing number to test the ranges of its prefix.
+    """
+
+    __slots__ = ('exact', 'pattern', 'ranges')
+
+    def __init__(self, rule_values: list[str]):
+        exact = set()
+        patterns = []
+        ranges = {}
+        for rule_value in rule_values:
+            rule_value = os.path.normcase(rule_value)
+            if is_pattern(rule_value):
+                patterns.append(fnmatch.translate(rule_value))
+                continue
+            exact.add(rule_value)
+            if (value_range := parse_range(rule_value)) is not None:
+                prefix, start, end, step = value_range
+                ranges.setdefault(prefix, []).append((start, end, step))
+        self.exact = frozenset(exact)
+        self.pattern = re.compile('|'.join(patterns)) if patterns else None
+        self.ranges = {
+            prefix: NumberRanges(prefix_ranges)
+            for prefix, prefix_ranges in ranges.items()}
+
+    def __call__(self, value: str) -> bool:
+        value = os.path.normcase(value)
+        if value in self.exact:
+            return True
+        if self.ranges and self.match_ranges(value):
+            return True
+        return (
+            self.pattern is not None
+            and self.pattern.match(value) is not None)
+
+    def match_ranges(self, value: str) -> bool:
+        if not value.isascii():
+            return False
+        if (match := numbered_value_re.fullmatch(value)) is None:
+            return False
+        prefix, number = match.groups()
+        numbers = self.ranges.get(prefix)
+        return numbers is not None and int(number) in numbers
+
+
+class CompiledRules:
+    """Visibility predicate built from context rules"""
+
+    __slots__ = ('rules',)
+
+    def __init__(self, rules: list[dict]):
+        compiled = []
+        for rule in rules:
+            if not rule['use']:
+                continue
+            rule_variable, rule_value = rule['context']
+            matcher = ValueMatcher(rule_value_split(rule_value))
+            compiled.append((rule_variable, rule['mode'], matcher))
+        self.rules = tuple(compiled)
+
+    @property
+    def variables(self) -> frozenset[str]:
+        return frozenset(variable for variable, _, _ in self.rules)
+
+    def __call__(self, gsv_data: dict) -> bool:
+        for rule_variable, rule_mode, matcher in self.rules:
+            gsv_data_variable = gsv_data.get(rule_variable)
+            if not gsv_data_variable:
+                continue
+            match_found = matcher(gsv_data_variable)
+            if rule_mode == 'include' and not match_found:
+                return False
+            if rule_mode == 'exclude' and match_found:
+                return False
+        return True
+
+
+@lru_cache(maxsize=compiled_cache_size)
+def compile_rules(raw_rules: str) -> CompiledRules | None:
+    """Compile the JSON string stored in the rules knob"""
+    if not raw_rules:
+        return
+    return CompiledRules(json.loads(raw_rules))
+
+
+class SwitchTable:
+    """Resolution table of ContextSwitch rules
+
+    Rules are resolved from the last one to the first one. Exact values are
+    looked up in a dict, patterns and ranges are only tested if they come
+    after the matching exact value. Resolved indexes are memoized by value.
+    """
+
+    __slots__ = ('exact', 'patterns', 'resolved')
+
+    def __init__(self, rules: list[dict]):
+        self.exact = {}
+        patterns = []
+        for position, rule in enumerate(rules):
+            rule_value = rule.get('value')
+            index = rule.get('index')
+            if rule_value is None:
+                continue
+            if is_pattern(rule_value) or parse_range(rule_value):
+                patterns.append((position, ValueMatcher([rule_value]), index))
+            else:
+                self.exact[os.path.normcase(rule_value)] = (position, index)
+        self.patterns = tuple(reversed(patterns))
+        self.resolved = {}
+
+    def resolve(self, value: str) -> int | None:
+        if value in self.resolved:
+            return self.resolved[value]
+        position, index = self.exact.get(os.path.normcase(value), (-1, 0))
+        for pattern_position, matcher, pattern_index in self.patterns:
+            if pattern_position < position:
+                break
+            if matcher(value):
+                index = pattern_index
+                break
+        if len(self.resolved) < compiled_cache_size:
+            self.resolved[value] = index
+        return index
+
+
+@lru_cache(maxsize=compiled_cache_size)
+def compile_switch_rules(raw_rules: str) -> SwitchTable | None:
+    """Compile the JSON string stored in the ContextSwitch rules knob"""
+    if not raw_rules:
+        return
+    return SwitchTable(json.loads(raw_rules))
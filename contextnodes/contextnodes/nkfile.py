@@ -0,0 +1,267 @@
+"""Read node knobs from .nk script files without Nuke
+
+Only the subset of the TCL syntax written by Nuke is supported: node blocks,
+groups closed by end_group, and knob values written as bare words, quoted
+strings or braced strings.
+
+Files are memory mapped and read in a single pass, nodes are yielded one by
+one and only the knobs used by context nodes are kept.
+"""
+
+import mmap
+import os
+import re
+from typing import Iterator
+
+CONTEXT_RULES = 'context_rules'
+CONTEXT_SWITCH_VARIABLE = 'contextswitch_variable'
+CONTEXT_SWITCH_RULES = 'contextswitch_rules'
+GRAPH_SCOPE_VARIABLES = 'gsv'
+
+group_classes = frozenset((b'Group', b'LiveGroup', b'Gizmo'))
+captured_knobs = frozenset((
+    b'name', b'xpos', b'ypos', b'bdwidth', b'bdheight',
+    CONTEXT_RULES.encode(),
+    CONTEXT_SWITCH_VARIABLE.encode(),
+    CONTEXT_SWITCH_RULES.encode(),
+    GRAPH_SCOPE_VARIABLES.encode()))
+default_variable_sets = ('__default__', 'Default')
+tcl_escapes = {'n': '\n', 't': '\t', 'r': '\r'}
+
+node_class_re = re.compile(rb'[\w.]+')
+spaces_re = re.compile(rb'\s*')
+line_spaces_re = re.compile(rb'[ \t\r]*')
+bare_re = re.compile(rb'[^\s}]*')
+braced_re = re.compile(rb'\\.|[{}]', re.DOTALL)
+quoted_re = re.compile(rb'\\.|"', re.DOTALL)
+quote_or_brace_re = re.compile(rb'["{}]')
+
+
+def to_float(value: str | None, default: float | None = 0.0) -> float | None:
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:  # Expression
+        return default
+
+
+class NodeRecord:
+    __slots__ = (
+        'node_class', 'name', 'group', 'xpos', 'ypos', 'bdwidth', 'bdheight',
+        'knobs')
+
+    def __init__(self, node_class: str, group: str, knobs: dict[str, str]):
+        self.node_class = node_class
+        self.group = group
+        self.name = knobs.pop('name', node_class)
+        # None when not stored, like for Root or nodes placed by Nuke
+        self.xpos = to_float(knobs.pop('xpos', None), None)
+        self.ypos = to_float(knobs.pop('ypos', None), None)
+        self.bdwidth = to_float(knobs.pop('bdwidth', None))
+        self.bdheight = to_float(knobs.pop('bdheight', None))
+        self.knobs = knobs
+
+    def __repr__(self):
+        return f'<NodeRecord {self.node_class} {self.full_name}>'
+
+    @property
+    def full_name(self) -> str:
+        if self.group:
+            return f'{self.group}.{self.name}'
+        return self.name
+
+    @property
+    def context_rules(self) -> str | None:
+        return self.knobs.get(CONTEXT_RULES)
+
+    @property
+    def contextswitch_rules(self) -> str | None:
+        return self.knobs.get(CONTEXT_SWITCH_RULES)
+
+    @property
+    def contextswitch_variable(self) -> str | None:
+        return self.knobs.get(CONTEXT_SWITCH_VARIABLE)
+
+    @property
+    def graph_scope_variables(self) -> dict[str, str]:
+        """Default graph scope variables, only stored on Root"""
+        return parse_graph_scope_variables(
+            self.knobs.get(GRAPH_SCOPE_VARIABLES, ''))
+
+
+def unescape(value: str) -> str:
+    if '\\' not in value:
+        return value
+    chars = []
+    escaped = False
+    for c in value:
+        if escaped:
+            chars.append(tcl_escapes.get(c, c))
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        else:
+            chars.append(c)
+    return ''.join(chars)
+
+
+def read_token(data, pos: int) -> tuple[slice, bool, int]:
+    """Read the token starting at pos, whitespace must already be skipped
+
+    Return the slice of the token content, if it needs to be unescaped and
+    the position after the token."""
+    c = data[pos:pos + 1]
+    if c == b'{':
+        depth = 0
+        for match in braced_re.finditer(data, pos):
+            token = match.group()
+            if token == b'{':
+                depth += 1
+            elif token == b'}':
+                depth -= 1
+                if depth == 0:
+                    return slice(pos + 1, match.start()), False, match.end()
+        return slice(pos + 1, len(data)), False, len(data)
+    if c == b'"':
+        for match in quoted_re.finditer(data, pos + 1):
+            if match.group() == b'"':
+                return slice(pos + 1, match.start()), True, match.end()
+        return slice(pos + 1, len(data)), True, len(data)
+    end = bare_re.match(data, pos).end()
+    return slice(pos, end), True, end
+
+
+def decode(data, token: slice, escaped: bool) -> str:
+    value = data[token].decode('utf-8', 'replace')
+    return unescape(value) if escaped else value
+
+
+def split_list(value: str) -> list[str]:
+    """Split a TCL list into its elements"""
+    data = value.encode()
+    items = []
+    pos = 0
+    while True:
+        pos = spaces_re.match(data, pos).end()
+        if pos >= len(data):
+            return items
+        token, escaped, end = read_token(data, pos)
+        if end == pos:  # Unbalanced closing brace
+            pos += 1
+            continue
+        items.append(decode(data, token, escaped))
+        pos = end
+
+
+def find_default_variables(items: list[str], depth: int = 3) -> str | None:
+    for i, item in enumerate(items):
+        if item in default_variable_sets:
+            return items[i + 1] if i + 1 < len(items) else ''
+    if depth:
+        for item in items:
+            sub_items = split_list(item)
+            if sub_items != [item]:
+                variables = find_default_variables(sub_items, depth - 1)
+                if variables is not None:
+                    return variables
+
+
+def parse_graph_scope_variables(value: str) -> dict[str, str]:
+    """Parse the default set of the Root gsv knob
+
+    Variables are read as {name value} pairs or as a flat name value
+    list."""
+    variables = find_default_variables(split_list(value))
+    if not variables:
+        return {}
+    items = split_list(variables)
+    pairs = [split_list(item) for item in items]
+    if not all(len(pair) == 2 for pair in pairs):
+        pairs = zip(items[::2], items[1::2])
+    return {name: value for name, value in pairs}
+
+
+def read_node_body(data, pos: int) -> tuple[dict[str, str], int]:
+    """Read captured knobs of a node block, pos is after the opening brace"""
+    knobs = {}
+    size = len(data)
+    while True:
+        pos = spaces_re.match(data, pos).end()
+        if pos >= size:
+            return knobs, pos
+        if data[pos:pos + 1] == b'}':
+            return knobs, pos + 1
+        name, _, pos = read_token(data, pos)
+        name = data[name]
+        if name not in captured_knobs:
+            # Skip simple lines in one go
+            end_of_line = data.find(b'\n', pos)
+            if end_of_line != -1 and not quote_or_brace_re.search(
+                    data, pos, end_of_line):
+                pos = end_of_line
+                continue
+        values = []
+        while True:
+            pos = line_spaces_re.match(data, pos).end()
+            if pos >= size or data[pos:pos + 1] in (b'\n', b'}'):
+                break
+            token, escaped, pos = read_token(data, pos)
+            if name in captured_knobs:
+                values.append(decode(data, token, escaped))
+        if values:
+            knobs[name.decode()] = ' '.join(values)
+
+
+def iter_buffer_nodes(data) -> Iterator[NodeRecord]:
+    groups = []
+    size = len(data)
+    pos = 0
+    while pos < size:
+        pos = spaces_re.match(data, pos).end()
+        if pos >= size:
+            break
+        end_of_line = data.find(b'\n', pos)
+        if end_of_line == -1:
+            end_of_line = size
+        words = data[pos:end_of_line].split()
+        if words == [b'end_group']:
+            if groups:
+                groups.pop()
+            pos = end_of_line
+            continue
+        if (len(words) == 2 and words[1] == b'{'
+                and node_class_re.fullmatch(words[0])):
+            node_class = words[0]
+            knobs, pos = read_node_body(
+                data, data.find(b'{', pos, end_of_line) + 1)
+            record = NodeRecord(node_class.decode(), '.'.join(groups), knobs)
+            yield record
+            if node_class in group_classes:
+                groups.append(record.name)
+            continue
+        # Other commands (push, set, version...) possibly with braced
+        # arguments over multiple lines
+        while pos < size and data[pos:pos + 1] != b'\n':
+            pos = line_spaces_re.match(data, pos).end()
+            if pos < size and data[pos:pos + 1] not in (b'\n', b'}'):
+                _, _, pos = read_token(data, pos)
+            elif data[pos:pos + 1] == b'}':
+                pos += 1
+
+
+def iter_nodes(path: str) -> Iterator[NodeRecord]:
+    """Yield node records of the script in file order
+
+    Group nesting is given by the record group, the full name of the parent
+    group ('' for root). Positions and backdrop sizes are floats, other
+    captured knobs are strings in the record knobs."""
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from iter_buffer_nodes(data)
+
+
+def read_nodes(path: str) -> list[NodeRecord]:
+    return list(iter_nodes(path))
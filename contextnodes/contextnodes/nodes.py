@@ -1,38 +1,66 @@
-import fnmatch
-from typing import Callable
+import json
+from contextlib import contextmanager
+from typing import Callable, Iterator
 import nuke
-import nukescripts.create
-from contextnodes.knobs import CONTEXT_RULES, add_context_knobs
-from contextnodes.rules import build_rule_data, update_rules, get_rules
+from contextnodes.knobs import (
+    CONTEXT_RULES, add_context_knobs, has_context_rules)
+from contextnodes.rules import (
+    RulesTransaction,
+    index_rules,
+    clear_rules_index,
+    get_indexed_nodes)
+from contextnodes.matching import ValueMatcher, compile_rules
 from contextnodes.preferences import (
     PREFS_BACKDROP_APPEARANCE_KNOB,
     get_preferences_node)
 from qtbinding import QtCore
-from vgnuke.nodetree import get_grid_size, get_all_instances
+from vgnuke.nodetree import get_all_instances, iter_instances
 from vgnuke.root import is_root_available
-from vgnuke.knobs import get_knob_value
-from vgnuke.backdrop import get_content as get_backdrop_content
+from vgnuke.knobs import get_knob_value, set_knob_values
+from vgnuke.backdrop import (
+    ContentIndex,
+    create_backdrops,
+    fit_backdrops,
+    get_content as get_backdrop_content)
 
 CONTEXT_BACKDROP_NAME = 'ContextBackdrop'
 FONT_SIZE = 16
 ENABLE_COLOR = 1099839487
 DISABLE_COLOR = 2385983487
 LABEL_COLOR = 4294967295
-
-context_value_separator = ','
+UPDATE_CONTENT_KNOBS = frozenset(
+    (CONTEXT_RULES, 'xpos', 'ypos', 'bdwidth', 'bdheight', 'showPanel'))
+SWITCH_VISIBILITY_UNDO = 'Switch Context Visibility'
+FIT_CONTEXT_BACKDROPS_UNDO = 'Fit Context Backdrops'
+# __import__ returns the already imported package from sys.modules
+AUTOLABEL_EXPRESSION = (
+    "__import__('contextnodes.nodes').nodes.auto_label_node()")
 
 
 def auto_label(node: nuke.Node | None = None):
+    """Return the label html of the node rules
+
+    Labels are cached per node, keyed on the raw rules, the node name and
+    the label knob, as autolabels are evaluated on every DAG redraw."""
     node = node or nuke.thisNode()
-    if CONTEXT_RULES not in node.knobs():
-        return
     context_rules_knob = node.knob(CONTEXT_RULES)
     if context_rules_knob is None:
         return
-    rules = get_rules(node)
-    if rules is None:
+    raw_rules = context_rules_knob.value()
+    if not raw_rules:
         return
-    label = '' if node.Class() == 'BackdropNode' else node.name()
+    name = '' if node.Class() == 'BackdropNode' else node.name()
+    key = (raw_rules, name, node['label'].value())
+    cached = auto_labels.get(node)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    label = build_label(json.loads(raw_rules), name, key[2])
+    auto_labels[node] = (key, label)
+    return label
+
+
+def build_label(rules: list[dict], name: str, node_label: str) -> str:
+    label = name
     for rule in rules:
         if not rule['use']:
             continue
@@ -47,7 +75,7 @@ def auto_label(node: nuke.Node | None = None):
                 '<center><span style="background-color: dimgray;">'
                 '<font size=2 color=gainsboro>exclude</font>'
                 '</span></center>')
-    label += node['label'].value()
+    label += node_label
     return label
 
 
@@ -57,69 +85,32 @@ def auto_label_node(node=None):
     return label
 
 
-def get_selected_nodes_by_group() -> dict[nuke.Group, nuke.Node]:
-    selected_nodes_by_group = {}
-
-    def check_node(node, parent_group=None):
-        if node['selected'].value():
-            group = parent_group if parent_group else nuke.root()
-            if group not in selected_nodes_by_group:
-                selected_nodes_by_group[group] = []
-            selected_nodes_by_group[group].append(node)
-        if node.Class() == 'Group':
-            for internal_node in node.nodes():
-                check_node(internal_node, parent_group=node)
-
-    for node in nuke.allNodes():
-        check_node(node)
+def get_selected_nodes_by_group() -> dict[nuke.Group, list[nuke.Node]]:
+    """Return selected nodes by group, groups without selection are left out
 
+    Selections are read with nuke.selectedNodes() in each group, and only
+    Group nodes are walked instead of reading the selected knob of every
+    node."""
+    selected_nodes_by_group = {}
+    groups = [nuke.root()]
+    for group in groups:  # Groups found inside are appended while iterating
+        with group:
+            if nodes := nuke.selectedNodes():
+                selected_nodes_by_group[group] = nodes
+        groups.extend(nuke.allNodes('Group', group=group))
     return selected_nodes_by_group
 
 
-def create_backdrops_for_selected_node() -> list[nuke.BackdropNode]:
-    selected_nodes_by_group = get_selected_nodes_by_group()
-    backdrops = []
-
-    for group, nodes in selected_nodes_by_group.items():
-        if not nodes:
-            continue
-
-        with group:  # Allow to create backdrops under each groups
-            backdrop = nukescripts.create.createNodeLocal(
-                'BackdropNode', inpanel=False)
-            backdrops.append(backdrop)
-
-            # Define size from nodes
-            minx, miny, maxx, maxy = (
-                float('inf'), float('inf'), float('-inf'), float('-inf'))
-            for node in nodes:
-                x, y = node['xpos'].value(), node['ypos'].value()
-                x = x + node.screenWidth() / 2
-                y = y + node.screenHeight() / 2
-                if x < minx:
-                    minx = x
-                if y < miny:
-                    miny = y
-                if x > maxx:
-                    maxx = x
-                if y > maxy:
-                    maxy = y
-
-            # Adjust size with padding from grid size
-            grid_width, grid_height = get_grid_size()
-            width = maxx - minx + grid_width * 2
-            height = maxy - miny + grid_height * 4
-
-            center_x = (minx + maxx) / 2
-            center_y = (miny + maxy) / 2
-
-            # Move backdrop
-            backdrop['xpos'].setValue(center_x - width / 2)
-            backdrop['ypos'].setValue((center_y - height / 2) - grid_height)
-            backdrop['bdwidth'].setValue(width)
-            backdrop['bdheight'].setValue(height)
+def create_backdrops_for_selected_node(
+        selection: dict[nuke.Group, list[nuke.Node]] | None = None
+        ) -> list[nuke.BackdropNode]:
+    """Create a backdrop around the selected nodes of each group
 
-    return backdrops
+    selection is the result of get_selected_nodes_by_group(), it is read
+    when not given."""
+    if selection is None:
+        selection = get_selected_nodes_by_group()
+    return create_backdrops(selection)
 
 
 def get_graph_scope_variables(node: nuke.Node | None = None):
@@ -144,32 +135,14 @@ def add_context_from_gsv(
         process_value: Callable | None = None,
         merge: bool = True):
     gsv_data = get_default_graph_scope_variables()
-    for variable, value in gsv_data.items():
-        if filter_variables is not None and variable not in filter_variables:
-            continue
-        append = True
-        if process_value is not None:
-            value = process_value(value)
-        if merge:
-            rules = get_rules(node) or []
-            for rule in reversed(rules):
-                rule_variable, rule_value = rule['context']
-                if rule_variable == variable:
-                    append = False
-                    rule_values = rule_value.split(context_value_separator)
-                    rule_values = [x.strip() for x in rule_values]
-                    if value in rule_values:
-                        break
-                    rule_values.append(value)
-                    rule_value = (context_value_separator + ' ').join(
-                        sorted(rule_values))
-                    rule['context'] = [rule_variable, rule_value]
-                    break
-            if not append:
-                update_rules(node=node, data=rules)
-        if append:
-            rule_data = build_rule_data(variable=variable, value=value)
-            update_rules(node=node, data=rule_data)
+    with RulesTransaction(node) as rules:
+        for variable, value in gsv_data.items():
+            if (filter_variables is not None
+                    and variable not in filter_variables):
+                continue
+            if process_value is not None:
+                value = process_value(value)
+            rules.add_value(variable, value, merge=merge)
 
 
 def remove_context_from_gsv(
@@ -177,31 +150,12 @@ def remove_context_from_gsv(
         filter_variables: list | None = None,
         match_value: Callable | None = None):
     gsv_data = get_default_graph_scope_variables()
-    for variable, value in gsv_data.items():
-        if filter_variables is not None and variable not in filter_variables:
-            continue
-        rules = get_rules(node) or []
-        is_updated = False
-        for rule in reversed(rules):  # Reversed to allow delete item
-            rule_variable, rule_value = rule['context']
-            if rule_variable == variable:
-                rule_values = rule_value.split(context_value_separator)
-                rule_values = [x.strip() for x in rule_values]
-                value_to_check = value
-                if match_value is not None:
-                    value_to_check = match_value(rule_values, value)
-                if value_to_check not in rule_values:
-                    continue
-                is_updated = True
-                rule_values.remove(value_to_check)
-                if rule_values:
-                    rule_value = (context_value_separator + ' ').join(
-                        sorted(rule_values))
-                    rule['context'] = [rule_variable, rule_value]
-                else:
-                    rules.remove(rule)
-        if is_updated:
-            update_rules(node=node, data=rules)
+    with RulesTransaction(node) as rules:
+        for variable, value in gsv_data.items():
+            if (filter_variables is not None
+                    and variable not in filter_variables):
+                continue
+            rules.remove_value(variable, value, match_value)
 
 
 def _set_context_look(node):
@@ -210,8 +164,10 @@ def _set_context_look(node):
     node['note_font_color'].setValue(LABEL_COLOR)
 
 
-def create_context_backdrops() -> list[nuke.BackdropNode]:
-    backdrops = create_backdrops_for_selected_node()
+def create_context_backdrops(
+        selection: dict[nuke.Group, list[nuke.Node]] | None = None
+        ) -> list[nuke.BackdropNode]:
+    backdrops = create_backdrops_for_selected_node(selection)
     for bd in backdrops:
         add_context_knobs(node=bd)
         appearance = get_preferences_node()[
@@ -238,8 +194,11 @@ def clear_context_node(node: nuke.Node):
     QtCore.QTimer.singleShot(0, lambda: node.showControlPanel())
 
 
-def set_context_backdrops_from_selection():
-    for group, nodes in get_selected_nodes_by_group().items():
+def set_context_backdrops_from_selection(
+        selection: dict[nuke.Group, list[nuke.Node]] | None = None):
+    if selection is None:
+        selection = get_selected_nodes_by_group()
+    for group, nodes in selection.items():
         if not nodes:
             continue
         with group:  # Allow to set backdrops under each groups
@@ -247,13 +206,16 @@ def set_context_backdrops_from_selection():
                 n for n in nodes
                 if n.Class() == 'BackdropNode' and n.knob(CONTEXT_RULES)]
             if not backdrops:
-                backdrops = create_context_backdrops()
+                backdrops = create_context_backdrops({group: nodes})
             for node in backdrops:
                 set_context_node(node)
 
 
-def set_context_nodes_from_selection():
-    for group, nodes in get_selected_nodes_by_group().items():
+def set_context_nodes_from_selection(
+        selection: dict[nuke.Group, list[nuke.Node]] | None = None):
+    if selection is None:
+        selection = get_selected_nodes_by_group()
+    for group, nodes in selection.items():
         nodes = [n for n in nodes if n.Class() != 'BackdropNode']
         if not nodes:
             continue
@@ -265,39 +227,71 @@ def set_context_nodes_from_selection():
                 set_context_node(node)
 
 
-def match_rule_value(test_value: str, rule_value: str) -> bool:
-    return fnmatch.fnmatch(test_value, rule_value)
+def fit_context_backdrops() -> list[nuke.BackdropNode]:
+    """Fit all context backdrops to their content and update visibility of
+    nodes they now contain"""
+    backdrops = [
+        n for n in iter_instances('BackdropNode')
+        if n.knob(CONTEXT_RULES) is not None]
+    undo = nuke.Undo()
+    undo.begin(FIT_CONTEXT_BACKDROPS_UNDO)
+    try:
+        with applying_visibility():
+            fit_backdrops(backdrops, undo_name=None)
+        switch_visibility(backdrops, undo_name=None)
+    finally:
+        undo.end()
+    return backdrops
 
 
-def rule_value_split(rule_value: str) -> list[str]:
-    rule_values = rule_value.split(context_value_separator)
-    return [x.strip() for x in rule_values]
+def match_rule_value(test_value: str, rule_value: str) -> bool:
+    return ValueMatcher([rule_value])(test_value)
 
 
-def check_assignation_visibility(node) -> bool:
-    rules = get_rules(node)
-    if rules is None:
+def check_assignation_visibility(
+        node, gsv_data: dict | None = None) -> bool:
+    compiled_rules = compile_rules(get_knob_value(node, CONTEXT_RULES))
+    if compiled_rules is None:
         return False
-    gsv_data = get_default_graph_scope_variables()
-    for rule in rules:
-        if not rule['use']:
-            continue
-        rule_variable, rule_value = rule['context']
-        rule_mode = rule['mode']
-        gsv_data_variable = gsv_data.get(rule_variable)
-        if not gsv_data_variable:
-            continue
-        rule_values = rule_value_split(rule_value)
-        match_found = any(
-            match_rule_value(gsv_data_variable, rv) for rv in rule_values)
-        if rule_mode == 'include' and not match_found:
-            return False
-        if rule_mode == 'exclude' and match_found:
-            return False
-    return True
+    gsv_data = gsv_data or get_default_graph_scope_variables()
+    return compiled_rules(gsv_data)
 
 
-def update_content(node: nuke.Node | None = None):
+def get_visibility_values(
+        node: nuke.Node,
+        enable: bool,
+        content_index: ContentIndex | None = None) -> list[tuple]:
+    """Return (node, knob name, value) to set to apply the visibility"""
+    values = []
+    nodes = (
+        get_backdrop_content(node, index=content_index)
+        if node.Class() == 'BackdropNode' else [node])
+    for n in nodes:
+        if n.knob('disable') is not None:
+            values.append((n, 'disable', not enable))
+        if n.Class() != 'BackdropNode':
+            # Autolabel is not working on * nodes. This is then set here.
+            values.append((n, 'autolabel', AUTOLABEL_EXPRESSION))
+    color = ENABLE_COLOR if enable else DISABLE_COLOR
+    values.append((node, 'tile_color', color))
+    return values
+
+
+@contextmanager
+def applying_visibility():
+    """Ignore knob changed callbacks triggered by visibility writes"""
+    global is_applying_visibility
+    previous = is_applying_visibility
+    is_applying_visibility = True
+    try:
+        yield
+    finally:
+        is_applying_visibility = previous
+
+
+def update_content(
+        node: nuke.Node | None = None,
+        content_index: ContentIndex | None = None):
     if not is_root_available():  # HACK: check root availibilty to avoid issue
         # on loading .nk file.
         return
@@ -306,57 +300,149 @@ def update_content(node: nuke.Node | None = None):
     if not rules:
         return
     enable = check_assignation_visibility(node)
-    nodes = (
-        get_backdrop_content(node)
-        if node.Class() == 'BackdropNode' else [node])
-    for n in nodes:
-        if 'disable' in n.knobs():
-            n.knob('disable').setValue(not enable)
-        if n.Class() != 'BackdropNode':
-            # Autolabel is not working on * nodes. This is then set here.
-            n['autolabel'].setValue(
-                "__import__('importlib')"
-                ".import_module('contextnodes.nodes').auto_label_node()")
-    color = ENABLE_COLOR if enable else DISABLE_COLOR
-    node.knob('tile_color').setValue(color)
+    with applying_visibility():
+        set_knob_values(get_visibility_values(node, enable, content_index))
 
 
-def switch_visibility():
-    for node in get_all_instances():
-        update_content(node)
+def update_content_on_knob_changed():
+    """Knob changed callback registered for all node classes
 
+    It is called on every knob change of every node, so it exits as soon as
+    possible for knobs and nodes unrelated to context rules, and while
+    visibility is being applied."""
+    if is_applying_visibility:
+        return
+    knob_name = nuke.thisKnob().name()
+    if knob_name not in UPDATE_CONTENT_KNOBS:
+        return
+    node = nuke.thisNode()
+    if not has_context_rules(node):
+        return
+    if knob_name == CONTEXT_RULES:
+        # Rules may be changed without update_rules(), by undo or scripts
+        index_rules(node)
+    update_content(node)
+
+
+def switch_visibility(
+        nodes: list[nuke.Node] | None = None,
+        gsv_data: dict | None = None,
+        undo_name: str | None = SWITCH_VISIBILITY_UNDO) -> int:
+    """Evaluate the rules of all nodes in one pass and apply visibility
+
+    Graph scope variables are read once and each distinct rule set is only
+    evaluated once. Knobs are only written when their value changes, in a
+    single undo step unless undo_name is None, the number of written knobs
+    is returned.
+    """
+    gsv_data = gsv_data or get_default_graph_scope_variables()
+    nodes = get_all_instances() if nodes is None else nodes
+    content_index = ContentIndex()
+    visibility_by_rules = {}
+    values = {}
+    for node in nodes:
+        rules = get_knob_value(node, CONTEXT_RULES)
+        if not rules:
+            continue
+        enable = visibility_by_rules.get(rules)
+        if enable is None:
+            enable = compile_rules(rules)(gsv_data)
+            visibility_by_rules[rules] = enable
+        # Last evaluated node wins, as when nodes were updated one by one
+        for n, knob_name, value in get_visibility_values(
+                node, enable, content_index):
+            values[(n, knob_name)] = value
+    with applying_visibility():
+        return set_knob_values(
+            ((n, knob_name, value)
+             for (n, knob_name), value in values.items()),
+            undo_name=undo_name)
+
+
+def index_all_rules():
+    clear_rules_index()
+    for node in get_all_instances():
+        if node.knob(CONTEXT_RULES) is not None:
+            index_rules(node)
+    last_gsv_data.clear()
+
+
+def update_changed_variables(gsv_data: dict | None = None) -> int:
+    """Apply visibility only on nodes using variables changed since the
+    last call"""
+    gsv_data = dict(gsv_data or get_default_graph_scope_variables())
+    changed_variables = {
+        variable for variable in gsv_data.keys() | last_gsv_data.keys()
+        if gsv_data.get(variable) != last_gsv_data.get(variable)}
+    last_gsv_data.clear()
+    last_gsv_data.update(gsv_data)
+    if not changed_variables:
+        return 0
+    # Falls back on all nodes if the index is out of date
+    nodes = get_indexed_nodes(changed_variables)
+    return switch_visibility(nodes=nodes, gsv_data=gsv_data)
+
+
+def iter_visible_nodes(
+        node_class: str | list[str] | None = None,
+        gsv_data: dict | None = None) -> Iterator[nuke.Node]:
+    """Yield visible nodes of the given class, see get_visible_nodes()
+
+    Backdrops and nodes of the given class are collected in one traversal,
+    then nodes outside hidden backdrop content are streamed. Each distinct
+    rule set is only evaluated once."""
+    gsv_data = gsv_data or get_default_graph_scope_variables()
+    visibility_by_rules = {}
+
+    def is_visible(node):
+        knob = node.knob(CONTEXT_RULES)
+        if knob is None:
+            return True
+        rules = knob.value()
+        visible = visibility_by_rules.get(rules)
+        if visible is None:
+            compiled_rules = compile_rules(rules)
+            visible = compiled_rules is not None and compiled_rules(gsv_data)
+            visibility_by_rules[rules] = visible
+        return visible
 
-def get_visible_nodes(node_class: str | list[str] | None = None):
+    if isinstance(node_class, str):
+        node_class = [node_class]
+    traversed_classes = (
+        None if node_class is None else {*node_class, 'BackdropNode'})
+    backdrops = []
+    nodes = []
+    for node in iter_instances(traversed_classes):
+        if node.Class() == 'BackdropNode':
+            backdrops.append(node)
+        if node_class is None or node.Class() in node_class:
+            nodes.append(node)
+
+    content_index = ContentIndex()
+    hidden_nodes = set()
+    for backdrop in backdrops:
+        if not is_visible(backdrop):
+            hidden_nodes.update(
+                get_backdrop_content(backdrop, index=content_index))
+    for node in nodes:
+        if node not in hidden_nodes and is_visible(node):
+            yield node
+
+
+def get_visible_nodes(
+        node_class: str | list[str] | None = None,
+        gsv_data: dict | None = None) -> list[nuke.Node]:
     """Get all visible nodes of the given class
 
     Nodes are included if no rule disables them.
     Nodes outside a context backdrop or without any rule are also included.
     """
-    not_visible_nodes = []
-    # Filter backdrop context content
-    not_visible_multishot_backdrop_nodes = [
-        n for n in get_all_instances(node_class='BackdropNode')
-        if CONTEXT_RULES in n.knobs()
-        and not check_assignation_visibility(n)]
-    for bd in not_visible_multishot_backdrop_nodes:
-        not_visible_nodes.extend(get_backdrop_content(bd))
-    if isinstance(node_class, str):
-        node_class = [node_class]
-    if node_class is None:
-        all_nodes = get_all_instances()
-    else:
-        all_nodes = []
-        for nc in node_class:
-            all_nodes.extend(get_all_instances(nc))
-    nodes = [n for n in all_nodes if n not in not_visible_nodes]
-    # Filter single nodes with CONTEXT_RULES knob
-    nodes = [
-        n for n in nodes
-        if (CONTEXT_RULES in n.knobs() and check_assignation_visibility(n))
-        or CONTEXT_RULES not in n.knobs()]
-    return nodes
+    return list(iter_visible_nodes(node_class, gsv_data))
 
 
+last_gsv_data = {}
+auto_labels = {}  # (key, label) by node
+is_applying_visibility = False
 add_context_callbacks = [add_context_from_gsv]
 remove_context_callbacks = [remove_context_from_gsv]
 
@@ -3,7 +3,7 @@
 [
     {
         'use': True,
-        'context': ('shots', '10:10-30;20'),
+        'context': ('shots', '010_0010, 010_0050-010_0100, 010_02*'),
         'mode': 'include'
     },
     {
@@ -15,8 +15,15 @@
 """
 
 import json
+from typing import Callable
 import nuke
 from contextnodes.knobs import CONTEXT_RULES
+from contextnodes.matching import rule_value_join, rule_value_split
+
+# Reverse index of the variables used by rules, by node. Nodes are used as
+# keys, not names, so renamed nodes and nodes of renamed groups are kept.
+nodes_by_variable: dict[str, set[nuke.Node]] = {}
+variables_by_node: dict[nuke.Node, frozenset[str]] = {}
 
 
 def build_rule_data(
@@ -44,6 +51,7 @@ def update_rules(
     elif isinstance(data, list):
         rules = data
     node[CONTEXT_RULES].setValue(json.dumps(rules))
+    index_rules(node, rules)
 
 
 def find_rule(rules: list, variable: str) -> tuple[int, dict] | None:
@@ -51,3 +59,207 @@ def find_rule(rules: list, variable: str) -> tuple[int, dict] | None:
         context_variable, _ = rule['context']
         if context_variable == variable:
             return index, rule
+
+
+class ContextRule:
+    """Rule of a RuleSet
+
+    Values are only split when first needed and the rule dict is kept as
+    read, so unchanged rules are written back as they were."""
+
+    __slots__ = ('key', 'data', 'variable', 'value_set', 'changed')
+
+    def __init__(self, key: int, data: dict):
+        self.key = key
+        self.data = data
+        self.variable = data['context'][0]
+        self.value_set = None
+        self.changed = False
+
+    def get_value_set(self) -> set[str]:
+        if self.value_set is None:
+            self.value_set = set(rule_value_split(self.data['context'][1]))
+        return self.value_set
+
+    @property
+    def values(self) -> tuple[str, ...]:
+        return tuple(sorted(self.get_value_set()))
+
+    def add(self, value: str) -> bool:
+        value_set = self.get_value_set()
+        if value in value_set:
+            return False
+        value_set.add(value)
+        self.changed = True
+        return True
+
+    def remove(self, value: str) -> bool:
+        value_set = self.get_value_set()
+        if value not in value_set:
+            return False
+        value_set.remove(value)
+        self.changed = True
+        return True
+
+    def to_dict(self) -> dict:
+        if self.changed:
+            self.data['context'] = [
+                self.variable, rule_value_join(self.value_set)]
+            self.changed = False
+        return self.data
+
+
+class RuleSet:
+    """Rules indexed by variable
+
+    Rules are kept in insertion order in dicts, so adding or removing a
+    rule or a value doesn't scan the rule list. Serializes to the JSON
+    format of the rules knob, see to_json() and from_json().
+    """
+
+    __slots__ = ('rules', 'rules_by_variable', 'next_key', 'changed')
+
+    def __init__(self, rules: list[dict] | None = None):
+        self.rules = {}
+        self.rules_by_variable = {}
+        self.next_key = 0
+        self.changed = False
+        for data in rules or ():
+            self.add_rule(data)
+        self.changed = False
+
+    @classmethod
+    def from_json(cls, raw_rules: str | None) -> 'RuleSet':
+        return cls(json.loads(raw_rules) if raw_rules else None)
+
+    def to_list(self) -> list[dict]:
+        return [rule.to_dict() for rule in self.rules.values()]
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_list())
+
+    def __iter__(self):
+        return iter(self.rules.values())
+
+    def __len__(self):
+        return len(self.rules)
+
+    @property
+    def variables(self) -> frozenset[str]:
+        return frozenset(self.rules_by_variable)
+
+    def get_variable_rules(self, variable: str) -> list[ContextRule]:
+        return list(self.rules_by_variable.get(variable, {}).values())
+
+    def find_rule(self, variable: str) -> ContextRule | None:
+        """Return the last rule of the variable"""
+        variable_rules = self.rules_by_variable.get(variable)
+        if variable_rules:
+            return variable_rules[next(reversed(variable_rules))]
+
+    def add_rule(self, data: dict) -> ContextRule:
+        rule = ContextRule(self.next_key, data)
+        self.next_key += 1
+        self.rules[rule.key] = rule
+        self.rules_by_variable.setdefault(rule.variable, {})[rule.key] = rule
+        self.changed = True
+        return rule
+
+    def remove_rule(self, rule: ContextRule):
+        variable_rules = self.rules_by_variable[rule.variable]
+        del variable_rules[rule.key]
+        if not variable_rules:
+            del self.rules_by_variable[rule.variable]
+        del self.rules[rule.key]
+        self.changed = True
+
+    def add_value(self, variable: str, value: str, merge: bool = True):
+        """Add the value to the last rule of the variable, or to a new rule
+        if there is none or merge is False"""
+        rule = self.find_rule(variable) if merge else None
+        if rule is None:
+            self.add_rule(build_rule_data(variable=variable, value=value))
+        elif rule.add(value):
+            self.changed = True
+
+    def remove_value(
+            self,
+            variable: str,
+            value: str,
+            match_value: Callable | None = None):
+        """Remove the value from all rules of the variable, rules left
+        without value are removed
+
+        match_value(rule_values, value) returns the rule value to remove."""
+        for rule in reversed(self.get_variable_rules(variable)):
+            value_to_check = value
+            if match_value is not None:
+                value_to_check = match_value(list(rule.values), value)
+            if not rule.remove(value_to_check):
+                continue
+            self.changed = True
+            if not rule.get_value_set():
+                self.remove_rule(rule)
+
+
+class RulesTransaction:
+    """Edit the rules of a node with a single decode and a single write
+
+    Entering the context returns the RuleSet of the node, which is written
+    when leaving it, only if it changed and no exception was raised.
+
+    Example:
+        with RulesTransaction(node) as rules:
+            rules.add_value('shot', '010_0010')
+            rules.remove_value('seq', '020')
+    """
+
+    def __init__(self, node: nuke.Node):
+        self.node = node
+        self.rules = None
+
+    def __enter__(self) -> RuleSet:
+        self.rules = RuleSet(get_rules(self.node))
+        return self.rules
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None and self.rules.changed:
+            update_rules(self.node, self.rules.to_list())
+
+
+def index_rules(node: nuke.Node, rules: list[dict] | None = None):
+    """Update the variables index of the node from its rules"""
+    if rules is None:
+        rules = get_rules(node) or []
+    variables = frozenset(rule['context'][0] for rule in rules)
+    unindex_rules(node)
+    if not variables:
+        return
+    variables_by_node[node] = variables
+    for variable in variables:
+        nodes_by_variable.setdefault(variable, set()).add(node)
+
+
+def unindex_rules(node: nuke.Node):
+    for variable in variables_by_node.pop(node, ()):
+        if nodes := nodes_by_variable.get(variable):
+            nodes.discard(node)
+
+
+def clear_rules_index():
+    nodes_by_variable.clear()
+    variables_by_node.clear()
+
+
+def get_indexed_nodes(variables: set[str]) -> list[nuke.Node] | None:
+    """Return nodes with rules referencing any of the given variables
+
+    None is returned if an indexed node can't be used anymore, the index
+    is then out of date and all nodes have to be checked."""
+    nodes = set()
+    for variable in variables:
+        nodes.update(nodes_by_variable.get(variable, ()))
+    try:
+        return sorted(nodes, key=lambda n: n.fullName())
+    except ValueError:  # Node deleted without onDestroy callback
+        return
@@ -1,4 +1,5 @@
 import json
+import os
 import re
 from contextlib import contextmanager
 import nuke
@@ -7,13 +8,18 @@ from qtbinding import QtCore
 from vgnuke.knobs import create_knob
 from vgnuke.root import is_root_available
 from contextnodes.knobs import CONTEXT_TAB
-from contextnodes.nodes import (
-    get_default_graph_scope_variables, match_rule_value)
+from contextnodes.nodes import get_default_graph_scope_variables
+from contextnodes.matching import compile_switch_rules
 
 CONTEXT_SWITCH_VARIABLE = 'contextswitch_variable'
 CONTEXT_SWITCH_RULES = 'contextswitch_rules'
 CONTEXT_SWITCH_RULES_PY = 'contextswitch_rules_py'
 NODE_NAME = 'ContextSwitch'
+BAKE_ENV = 'CONTEXTNODES_BAKE_SWITCH'
+SWITCH_EXPRESSION = (
+    "[python -execlocal ret="
+    "__import__('importlib').import_module('contextnodes.switch')"
+    ".resolve_index(node=nuke.thisNode())]")
 
 
 @contextmanager
@@ -34,8 +40,54 @@ def sync_variable_knob(node: nuke.Node | None = None):
     # with enter_group(node) as _:
     #     if switch_node := nuke.toNode('Switch'):
     #         switch_node[CONTEXT_SWITCH_VARIABLE].setValue(value)
-    [n[CONTEXT_SWITCH_VARIABLE].setValue(value)
-     for n in node.nodes() if n.Class() == 'Switch']
+    switch_nodes = [n for n in node.nodes() if n.Class() == 'Switch']
+    [n[CONTEXT_SWITCH_VARIABLE].setValue(value) for n in switch_nodes]
+    if is_bake_mode():
+        bake_context_switches(switch_nodes)
+
+
+def is_bake_mode() -> bool:
+    """Baked mode writes resolved indexes on the which knob instead of
+    evaluating a Python expression. Used in terminal mode or when the
+    environment variable is set."""
+    return not nuke.GUI or bool(os.environ.get(BAKE_ENV))
+
+
+def get_context_switch_nodes() -> list[nuke.Node]:
+    return [
+        n for n in nuke.allNodes('Switch', recurseGroups=True)
+        if n.knob(CONTEXT_SWITCH_RULES) is not None]
+
+
+def set_switch_expression(node: nuke.Node):
+    node['which'].setExpression(SWITCH_EXPRESSION)
+
+
+def bake_index(node: nuke.Node) -> bool:
+    index = resolve_index(node)
+    if index is None:
+        return False
+    which_knob = node['which']
+    if which_knob.hasExpression():
+        which_knob.clearAnimated()
+    if which_knob.value() != index:
+        which_knob.setValue(index)
+    return True
+
+
+def bake_context_switches(nodes: list[nuke.Node] | None = None) -> int:
+    """Replace the which expression by the resolved index
+
+    Return the number of baked nodes."""
+    nodes = get_context_switch_nodes() if nodes is None else nodes
+    return sum(bake_index(node) for node in nodes)
+
+
+def restore_context_switch_expressions(
+        nodes: list[nuke.Node] | None = None):
+    nodes = get_context_switch_nodes() if nodes is None else nodes
+    for node in nodes:
+        set_switch_expression(node)
 
 
 def add_custom_switch_knob(
@@ -60,13 +112,11 @@ def add_custom_switch_knob(
         if node.Class() != 'Switch':
             return
         # which knob
-        expression = (
-            "[python -execlocal ret="
-            "__import__('importlib').import_module('contextnodes.switch')"
-            ".resolve_index(node=nuke.thisNode())]")
-        which_knob = node['which']
-        which_knob.setExpression(expression)
-        which_knob.setFlag(nuke.INVISIBLE)
+        if is_bake_mode():
+            bake_index(node)
+        else:
+            set_switch_expression(node)
+        node['which'].setFlag(nuke.INVISIBLE)
         if mode_knob := node.knob('mode'):  # For Nuke 15, it no longer exists
             # in Nuke 16.
             mode_knob.setFlag(nuke.INVISIBLE)
@@ -114,6 +164,8 @@ def get_rules(node: nuke.Node) -> list[dict] | None:
 
 def update_rules(node: nuke.Node, data: list[dict]):
     node[CONTEXT_SWITCH_RULES].setValue(json.dumps(data))
+    if node.Class() == 'Switch' and is_bake_mode():
+        bake_index(node)
 
 
 def resolve_index(node: nuke.Node):
@@ -123,16 +175,13 @@ def resolve_index(node: nuke.Node):
     variable = node[CONTEXT_SWITCH_VARIABLE].value()
     if not variable:
         return
-    rules = get_rules(node)
-    if rules is None:
+    switch_table = compile_switch_rules(node[CONTEXT_SWITCH_RULES].value())
+    if switch_table is None:
         return
     test_value = get_default_graph_scope_variables().get(variable)
-    for rule in reversed(rules):
-        rule_value = rule.get('value')
-        index = rule.get('index')
-        if match_rule_value(test_value=test_value, rule_value=rule_value):
-            return index
-    return 0
+    if test_value is None:
+        return 0
+    return switch_table.resolve(test_value)
 
 
 def safe_node_name(value, fallback='Input'):
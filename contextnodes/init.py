@@ -1,8 +1,17 @@
 from functools import partial
 import nuke
-from contextnodes.knobs import add_custom_rules_knob
-from contextnodes.nodes import auto_label, update_content
+from contextnodes.knobs import (
+    CONTEXT_RULES, add_custom_rules_knob, forget_context_rules_flag)
+from contextnodes.nodes import (
+    auto_label,
+    auto_labels,
+    update_content_on_knob_changed,
+    index_all_rules,
+    update_changed_variables)
+from contextnodes.rules import index_rules, unindex_rules
 from contextnodes.switch import (
+    is_bake_mode,
+    bake_context_switches,
     add_custom_switch_knob,
     sync_variable_knob,
     update_context_switch_group_content)
@@ -12,18 +21,53 @@ from contextnodes.preferences import create_preferences_knobs
 def sync_context_switch_on_load():
     for node in nuke.allNodes('ContextSwitch'):
         sync_variable_knob(node)
+    if is_bake_mode():
+        bake_context_switches()
+
+
+def bake_context_switches_before_render():
+    if is_bake_mode():
+        bake_context_switches()
+
+
+def index_rules_on_create():
+    node = nuke.thisNode()
+    forget_context_rules_flag(node)
+    if node.knob(CONTEXT_RULES) is not None:
+        index_rules(node)
+
+
+def unindex_rules_on_destroy():
+    node = nuke.thisNode()
+    forget_context_rules_flag(node)
+    if node.knob(CONTEXT_RULES) is not None:
+        unindex_rules(node)
+        auto_labels.pop(node, None)
+
+
+def update_visibility_on_gsv_changed():
+    if nuke.thisKnob().name() == 'gsv':
+        update_changed_variables()
+        if is_bake_mode():
+            bake_context_switches()
 
 
 nuke.addOnCreate(
     update_context_switch_group_content, nodeClass='ContextSwitch')
 nuke.addKnobChanged(sync_variable_knob, nodeClass='ContextSwitch')
 nuke.addOnScriptLoad(sync_context_switch_on_load)
+nuke.addBeforeRender(bake_context_switches_before_render)
 
 if nuke.GUI:
+    # The variables index is only used by GUI callbacks
+    nuke.addOnScriptLoad(index_all_rules)
+    nuke.addOnCreate(index_rules_on_create, nodeClass='*')
+    nuke.addOnDestroy(unindex_rules_on_destroy, nodeClass='*')
     nuke.addOnCreate(
         partial(add_custom_rules_knob, on_create=True),
         nodeClass='BackdropNode')
-    nuke.addKnobChanged(update_content, nodeClass='*')
+    nuke.addKnobChanged(update_content_on_knob_changed, nodeClass='*')
+    nuke.addKnobChanged(update_visibility_on_gsv_changed, nodeClass='Root')
     nuke.addAutolabel(auto_label, nodeClass='BackdropNode')
     # Autolabel is not working on * nodes. For all other node classes than
     # BackdropNode, it is set in update_content() function.
@@ -1,7 +1,12 @@
 import os
 from contextnodes.nodes import (
-    set_context_backdrops_from_selection, set_context_nodes_from_selection)
-from contextnodes.switch import create_context_switch_node
+    fit_context_backdrops,
+    set_context_backdrops_from_selection,
+    set_context_nodes_from_selection)
+from contextnodes.switch import (
+    create_context_switch_node,
+    bake_context_switches,
+    restore_context_switch_expressions)
 import nuke
 import nukescripts.create
 from functools import partial
@@ -20,12 +25,21 @@ def create_menus():
         name='Set Current Nodes',
         command=set_context_nodes_from_selection,
         shortcut='alt+f2')
+    menu.addCommand(
+        name='Fit Context Backdrops',
+        command=fit_context_backdrops)
     menu.addCommand(
         name='Create ContextSwitch',
         command=partial(
             nukescripts.create.createNodeLocal,
             'ContextSwitch',
             inpanel=False))
+    menu.addCommand(
+        name='Bake ContextSwitches',
+        command=bake_context_switches)
+    menu.addCommand(
+        name='Restore ContextSwitch Expressions',
+        command=restore_context_switch_expressions)
 
     nuke_toolbar = nuke.toolbar('Nodes')
     cn_menu = nuke_toolbar.addMenu('ContextNodes')
@@ -1,29 +1,173 @@
+from array import array
 import nuke
+import nukescripts.create
 from .typing import Node
+from .knobs import set_knob_values
+from .nodetree import get_grid_size
+from .spatial import DEFAULT_NODE_SIZE, NodeGrid
 
+FIT_BACKDROPS_UNDO = 'Fit Backdrops'
 
-def get_content(backdrop_node) -> list[Node]:
-    """Return the nodes contained in the backdrop
 
-    node.getNodes() can not be used because it is not supported with the
-    terminal mode of Nuke."""
+def get_node_size(node: Node) -> tuple[int, int]:
+    # BUG: node.screenWidth/node.screenHeight doesn't work in terminal mode
+    # and node.width/node.height gives wrong result
+    if nuke.GUI:
+        return node.screenWidth(), node.screenHeight()
+    return DEFAULT_NODE_SIZE
 
+
+def get_bounds(backdrop_node) -> tuple[float, float, float, float]:
     left = backdrop_node.xpos()
     top = backdrop_node.ypos()
     right = left + backdrop_node.knob('bdwidth').value()
     bottom = top + backdrop_node.knob('bdheight').value()
+    return left, top, right, bottom
+
+
+class ContentIndex:
+    """Spatial index answering backdrop content queries
+
+    One grid is built per group the first time a backdrop of that group is
+    queried. It is meant to live for a single pass over the script, call
+    invalidate() if nodes are moved, created or deleted during that pass.
+    """
+
+    def __init__(self):
+        self.grids = {}
+
+    def invalidate(self, group: Node | None = None):
+        if group is None:
+            self.grids.clear()
+        else:
+            self.grids.pop(group, None)
+
+    def get_grid(self, group: Node) -> NodeGrid:
+        grid = self.grids.get(group)
+        if grid is None:
+            grid = NodeGrid(
+                (node.xpos(), node.ypos(), *get_node_size(node), node)
+                for node in group.nodes())
+            self.grids[group] = grid
+        return grid
+
+    def get_content(self, backdrop_node) -> list[Node]:
+        group = backdrop_node.parent() or nuke.root()
+        return self.get_grid(group).query(*get_bounds(backdrop_node))
+
+
+def get_content(
+        backdrop_node,
+        index: ContentIndex | None = None) -> list[Node]:
+    """Return the nodes contained in the backdrop
+
+    node.getNodes() can not be used because it is not supported with the
+    terminal mode of Nuke."""
+
+    if index is not None:
+        return index.get_content(backdrop_node)
+    left, top, right, bottom = get_bounds(backdrop_node)
     nodes = []
     for node in nuke.allNodes():
         x = node.xpos()
         y = node.ypos()
-        # BUG: node.screenWidth/node.screenHeight doesn't work in terminal mode
-        # and node.width/node.height gives wrong result
-        if nuke.GUI:
-            width, height = node.screenWidth(), node.screenHeight()
-        else:
-            # NOTE: Not perfect, node size can be different if label or other
-            # setting is changed and makes the node bigger
-            width, height = 80, 18
+        width, height = get_node_size(node)
         if x > left and x + width < right and y > top and y + height < bottom:
             nodes.append(node)
     return nodes
+
+
+def get_extents(
+        nodes: list[Node],
+        backdrop_bounds: dict | None = None
+        ) -> tuple[float, float, float, float]:
+    """Return the min x, min y, max x and max y of the node centers
+
+    Backdrops count with their corners, taken from backdrop_bounds when
+    they are in it."""
+    backdrop_bounds = backdrop_bounds or {}
+    xs = array('d')
+    ys = array('d')
+    for node in nodes:
+        if node.Class() == 'BackdropNode':
+            bounds = backdrop_bounds.get(node) or get_bounds(node)
+            xs.extend(bounds[0::2])
+            ys.extend(bounds[1::2])
+            continue
+        width, height = get_node_size(node)
+        xs.append(node.xpos() + width / 2)
+        ys.append(node.ypos() + height / 2)
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def get_fit_bounds(
+        extents: tuple[float, float, float, float],
+        grid_size: tuple[int, int]) -> tuple[float, float, float, float]:
+    """Return the bounds of a backdrop around extents, padded from the grid
+    size"""
+    minx, miny, maxx, maxy = extents
+    grid_width, grid_height = grid_size
+    width = maxx - minx + grid_width * 2
+    height = maxy - miny + grid_height * 4
+    left = (minx + maxx) / 2 - width / 2
+    top = (miny + maxy) / 2 - height / 2 - grid_height
+    return left, top, left + width, top + height
+
+
+def get_bounds_values(backdrop_node, bounds: tuple) -> list[tuple]:
+    left, top, right, bottom = bounds
+    return [
+        (backdrop_node, 'xpos', left),
+        (backdrop_node, 'ypos', top),
+        (backdrop_node, 'bdwidth', right - left),
+        (backdrop_node, 'bdheight', bottom - top)]
+
+
+def create_backdrops(nodes_by_group: dict[Node, list[Node]]) -> list[Node]:
+    """Create a backdrop around the nodes of each group
+
+    Extents of all groups are read before any backdrop is created."""
+    grid_size = get_grid_size()
+    bounds_by_group = {
+        group: get_fit_bounds(get_extents(nodes), grid_size)
+        for group, nodes in nodes_by_group.items() if nodes}
+    backdrops = []
+    values = []
+    for group, bounds in bounds_by_group.items():
+        with group:  # Allow to create backdrops under each groups
+            backdrop = nukescripts.create.createNodeLocal(
+                'BackdropNode', inpanel=False)
+        backdrops.append(backdrop)
+        values.extend(get_bounds_values(backdrop, bounds))
+    set_knob_values(values)
+    return backdrops
+
+
+def fit_backdrops(
+        backdrop_nodes: list[Node],
+        index: ContentIndex | None = None,
+        undo_name: str | None = FIT_BACKDROPS_UNDO) -> int:
+    """Fit backdrops to their current content in a single undo step, none
+    if undo_name is None
+
+    Contents are found before any backdrop is moved. Nested backdrops are
+    fitted first so the backdrops around them follow. Backdrops without
+    content are left unchanged. Return the number of knobs written."""
+    index = index or ContentIndex()
+    contents = [(bd, index.get_content(bd)) for bd in backdrop_nodes]
+    contents.sort(key=lambda item: get_area(get_bounds(item[0])))
+    grid_size = get_grid_size()
+    fitted_bounds = {}
+    for backdrop_node, nodes in contents:
+        if nodes:
+            fitted_bounds[backdrop_node] = get_fit_bounds(
+                get_extents(nodes, fitted_bounds), grid_size)
+    values = []
+    for backdrop_node, bounds in fitted_bounds.items():
+        values.extend(get_bounds_values(backdrop_node, bounds))
+    return set_knob_values(values, undo_name=undo_name)
+
+
+def get_area(bounds: tuple[float, float, float, float]) -> float:
+    left, top, right, bottom = bounds
+    return (right - left) * (bottom - top)
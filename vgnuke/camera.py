@@ -1,41 +1,126 @@
 import nuke
 from .view import get_views
+from .nodetree import GraphSnapshot
+
+
+class TransformResolver:
+    """Find the top camera or axis nodes of an unchanged node tree
+
+    Results are memoized per node and view for every node met during the
+    walk, so resolving many nodes sharing the same upstream tree only walks
+    it once. Switch which values are read once. Create a new resolver after
+    the node tree is edited.
+    """
+
+    def __init__(self, snapshot: GraphSnapshot | None = None):
+        self.snapshot = snapshot
+        self.results = {}
+        self.switch_inputs = {}
+        self.views = None
+
+    def get_input(self, node: nuke.Node, index: int) -> nuke.Node | None:
+        if self.snapshot is not None and node in self.snapshot.ids:
+            return self.snapshot.input(node, index)
+        return node.input(index)
+
+    def get_inputs(self, node: nuke.Node) -> list[nuke.Node]:
+        inputs = (self.get_input(node, i) for i in range(node.inputs()))
+        return [n for n in inputs if n is not None]
+
+    def get_view(self, view: str | None) -> str:
+        if self.views is None:
+            self.views = get_views()
+        if view is None:
+            viewer = nuke.activeViewer()
+            if viewer:
+                view = viewer.view()
+        return view or self.views[0]
+
+    def get_next_nodes(
+            self, node: nuke.Node, view: str) -> list[nuke.Node]:
+        node_class = node.Class()
+        if node_class == 'Input':
+            input_node = self.get_input(
+                node.parent(), int(node['number'].value()))
+            return [] if input_node is None else [input_node]
+        if node_class == 'Switch':
+            if node not in self.switch_inputs:
+                active_input = int(node['which'].value())  # BUG: returns
+                # float
+                self.switch_inputs[node] = self.get_input(node, active_input)
+            input_node = self.switch_inputs[node]
+            return [] if input_node is None else [input_node]
+        if node_class == 'JoinViews':
+            view_index = self.views.index(view)  # Be carefull here, list of
+            # views in root node and JoinViews inputs might not match.
+            input_node = self.get_input(node, view_index)
+            if input_node is not None:
+                return [input_node]
+        return self.get_inputs(node)
+
+    def resolve(
+            self,
+            node: nuke.Node,
+            view: str | None = None) -> nuke.Node | None:
+        view = self.get_view(view)
+        results = self.results
+        in_progress = set()
+        # Depth first walk, each entry is [node, next nodes, pending node]
+        stack = [[node, None, None]]
+        while stack:
+            entry = stack[-1]
+            current, next_nodes, pending = entry
+            if next_nodes is None:
+                if current in results.get(view, ()):
+                    stack.pop()
+                    continue
+                if current.Class().startswith(('Camera', 'Axis')):
+                    results.setdefault(view, {})[current] = current
+                    stack.pop()
+                    continue
+                in_progress.add(current)
+                entry[1] = next_nodes = iter(
+                    self.get_next_nodes(current, view))
+            view_results = results.setdefault(view, {})
+            if pending is not None:
+                entry[2] = None
+                if (result := view_results.get(pending)) is not None:
+                    view_results[current] = result
+                    in_progress.discard(current)
+                    stack.pop()
+                    continue
+            next_node = next(next_nodes, None)
+            if next_node is None:
+                view_results[current] = None
+                in_progress.discard(current)
+                stack.pop()
+                continue
+            if next_node in view_results:
+                entry[2] = next_node
+                continue
+            if next_node in in_progress:  # Cycle through expression links
+                continue
+            entry[2] = next_node
+            stack.append([next_node, None, None])
+        return results[view].get(node)
+
+    def resolve_many(
+            self,
+            nodes: list[nuke.Node],
+            view: str | None = None) -> dict[nuke.Node, nuke.Node | None]:
+        return {node: self.resolve(node, view=view) for node in nodes}
 
 
 def find_top_transform_node(
         node: nuke.Node,
         view: str | None = None) -> nuke.Node | None:
+    return TransformResolver().resolve(node, view=view)
 
-    if node.Class() == 'Input':
-        node = node.parent().input(int(node['number'].value()))
-        if node is None:
-            return
-
-    if node.Class().startswith(('Camera', 'Axis')):
-        return node
-
-    if node.Class() == 'Switch':
-        active_input = int(node['which'].value())  # BUG: returns float
-        input_node = node.input(active_input)
-        if input_node is None:
-            return
-        return find_top_transform_node(input_node, view=view)
-
-    if node.Class() == 'JoinViews':
-        viewer = nuke.activeViewer()
-        if viewer:
-            view = view or viewer.view()
-        if view is None:
-            view = get_views()[0]
-        view_index = get_views().index(view)  # Be carefull here, list of views
-        # in root node and JoinViews inputs might not match.
-        input_node = node.input(view_index)
-        if input_node is not None:
-            return find_top_transform_node(input_node, view=view)
-
-    for i in range(node.inputs()):
-        input_node = node.input(i)
-        if input_node is not None:
-            parent_camera = find_top_transform_node(input_node, view=view)
-            if parent_camera is not None:
-                return parent_camera
+
+def find_top_transform_nodes(
+        nodes: list[nuke.Node],
+        view: str | None = None,
+        snapshot: GraphSnapshot | None = None
+        ) -> dict[nuke.Node, nuke.Node | None]:
+    """Resolve the top camera or axis of many nodes in one walk"""
+    return TransformResolver(snapshot).resolve_many(nodes, view=view)
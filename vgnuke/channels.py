@@ -1,6 +1,77 @@
+import os
 from typing import Optional
 import nuke
 from .typing import Node
+from .exr import ExrError, filter_channels, read_channels
+
+channels_cache_size = 1024
+# Channels read from exr headers by (file path, modification time, size)
+channels_cache = {}
+
+
+def clear_channels_cache():
+    channels_cache.clear()
+
+
+def get_file_path(node: Node) -> str | None:
+    if node.Class() != 'Read':
+        return
+    file_knob = node.knob('file')
+    if file_knob is None:
+        return
+    path = file_knob.evaluate()
+    if not path or os.path.splitext(path)[1].lower() != '.exr':
+        return
+    return path
+
+
+def read_file_channels(node: Node) -> list[str] | None:
+    """Read channels from the exr header of Read nodes
+
+    Headers are cached by file path and are read again when the file
+    changes on disk."""
+    path = get_file_path(node)
+    if path is None:
+        return
+    try:
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        channels = channels_cache.get(key)
+        if channels is None:
+            channels = read_channels(path)
+            if len(channels_cache) >= channels_cache_size:
+                del channels_cache[next(iter(channels_cache))]
+            channels_cache[key] = channels
+        return channels
+    except (OSError, ExrError, KeyError):
+        return
+
+
+def get_nodes_channels(nodes: list[Node]) -> dict[Node, list[str]]:
+    """Get channels of many nodes
+
+    Exr headers of Read nodes are read first. Other nodes share a single
+    temporary DeepToImage node."""
+    result = {}
+    remaining = []
+    for node in nodes:
+        channels = read_file_channels(node)
+        if channels is None:
+            remaining.append(node)
+        else:
+            result[node] = channels
+
+    if remaining:
+        # Connect a deepToImage to get channels
+        # Not working with deep image
+        deeptoimage = nuke.nodes.DeepToImage()
+        try:
+            for node in remaining:
+                deeptoimage.setInput(0, node)
+                result[node] = deeptoimage.channels()
+        finally:
+            nuke.delete(deeptoimage)
+    return result
 
 
 def get_available_channels(
@@ -9,16 +80,16 @@ def get_available_channels(
         keep_ext: bool = False) -> list:
     """Get all available channels"""
 
-    # Connect a deepToImage to get channels
-    # Not working with deep image
-    deeptoimage = nuke.nodes.DeepToImage()
-    deeptoimage.setInput(0, node)
-    channels = deeptoimage.channels()
-    nuke.delete(deeptoimage)
-
-    # Keep only the channel name without extension
-    result = list(set([c if keep_ext else c.split('.')[0] for c in channels]))
-    if prefix is not None:
-        result = [c for c in result if c.startswith(prefix)]
-    result.sort()
-    return result
+    channels = get_nodes_channels([node])[node]
+    return filter_channels(channels, prefix, keep_ext)
+
+
+def get_available_channels_batch(
+        nodes: list[Node],
+        prefix: Optional[str] = None,
+        keep_ext: bool = False) -> dict[Node, list]:
+    """Get all available channels of many nodes"""
+
+    return {
+        node: filter_channels(channels, prefix, keep_ext)
+        for node, channels in get_nodes_channels(nodes).items()}
@@ -0,0 +1,185 @@
+"""Read OpenEXR header attributes without Nuke
+
+Files are memory mapped and attributes are unpacked in place, so only the
+pages holding the headers are loaded, pixel data is never read.
+Single and multi-part files are supported.
+"""
+
+import fnmatch
+import mmap
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+MAGIC = 20000630
+MULTIPART_FLAG = 0x1000
+nuke_channel_names = {
+    'R': 'red', 'G': 'green', 'B': 'blue', 'A': 'alpha'}
+
+
+class ExrError(Exception):
+    pass
+
+
+class ExrHeader:
+    """Header of one part of an exr file"""
+
+    __slots__ = ('name', 'channels', 'data_window')
+
+    def __init__(
+            self,
+            name: str | None,
+            channels: list[str],
+            data_window: tuple[int, int, int, int] | None):
+        self.name = name
+        self.channels = channels
+        self.data_window = data_window
+
+    def __repr__(self):
+        return f'<ExrHeader {self.name} {len(self.channels)} channels>'
+
+    @property
+    def nuke_channels(self) -> list[str]:
+        return [get_nuke_channel_name(c) for c in self.channels]
+
+    @property
+    def layers(self) -> list[str]:
+        return filter_channels(self.nuke_channels)
+
+
+def read_string(data: mmap.mmap, pos: int, end: int) -> tuple[str, int]:
+    null = data.find(b'\0', pos, end)
+    if null == -1:
+        raise ExrError('Truncated OpenEXR header')
+    return data[pos:null].decode('utf-8', 'replace'), null + 1
+
+
+def parse_chlist(data: mmap.mmap, pos: int, end: int) -> list[str]:
+    channels = []
+    while pos < end and data[pos]:
+        name, pos = read_string(data, pos, end)
+        channels.append(name)
+        pos += 16  # pixel type, linear, reserved, sampling
+    return channels
+
+
+def parse_header(
+        data: mmap.mmap, pos: int) -> tuple[ExrHeader | None, int]:
+    """Parse the header starting at pos, return None for the empty header
+    ending the headers of multi-part files"""
+    size = len(data)
+    name = None
+    channels = []
+    data_window = None
+    is_empty = True
+    while True:
+        attribute_name, pos = read_string(data, pos, size)
+        if not attribute_name:
+            break
+        is_empty = False
+        attribute_type, pos = read_string(data, pos, size)
+        if pos + 4 > size:
+            raise ExrError('Truncated OpenEXR header')
+        value_size = struct.unpack_from('<i', data, pos)[0]
+        pos += 4
+        end = pos + value_size
+        if end > size:
+            raise ExrError('Truncated OpenEXR header')
+        if attribute_name == 'channels' and attribute_type == 'chlist':
+            channels = parse_chlist(data, pos, end)
+        elif attribute_name == 'dataWindow' and attribute_type == 'box2i':
+            data_window = struct.unpack_from('<4i', data, pos)
+        elif attribute_name == 'name' and attribute_type == 'string':
+            name = data[pos:end].decode('utf-8', 'replace')
+        pos = end
+    if is_empty:
+        return None, pos
+    return ExrHeader(name, channels, data_window), pos
+
+
+def read_headers(path: str) -> list[ExrHeader]:
+    """Return the headers of all parts of the file"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < 8:
+            raise ExrError(f'Not an OpenEXR file: {path}')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version = struct.unpack_from('<ii', data)
+            if magic != MAGIC:
+                raise ExrError(f'Not an OpenEXR file: {path}')
+            headers = []
+            pos = 8
+            try:
+                while True:
+                    header, pos = parse_header(data, pos)
+                    if header is None:
+                        break
+                    headers.append(header)
+                    if not version & MULTIPART_FLAG:
+                        break
+            except ExrError as e:
+                raise ExrError(f'{e}: {path}') from None
+            return headers
+
+
+def get_nuke_channel_name(name: str) -> str:
+    """Return the channel name as shown by the Nuke exr reader"""
+    layer, _, channel = name.rpartition('.')
+    if not layer:
+        if channel in nuke_channel_names:
+            return f'rgba.{nuke_channel_names[channel]}'
+        if channel == 'Z':
+            return 'depth.Z'
+        return f'other.{channel}'
+    layer = layer.replace('.', '_')
+    return f'{layer}.{nuke_channel_names.get(channel, channel)}'
+
+
+def filter_channels(
+        channels: list[str],
+        prefix: Optional[str] = None,
+        keep_ext: bool = False) -> list[str]:
+    # Keep only the channel name without extension
+    result = list(set([c if keep_ext else c.split('.')[0] for c in channels]))
+    if prefix is not None:
+        result = [c for c in result if c.startswith(prefix)]
+    result.sort()
+    return result
+
+
+def read_channels(
+        path: str,
+        prefix: Optional[str] = None,
+        keep_ext: bool = True) -> list[str]:
+    """Return the channel names of all parts as named in Nuke
+
+    prefix and keep_ext filter like vgnuke.channels.get_available_channels()
+    """
+    channels = [c for h in read_headers(path) for c in h.nuke_channels]
+    if keep_ext and prefix is None:
+        return channels
+    return filter_channels(channels, prefix, keep_ext)
+
+
+def read_directory_headers(
+        directory: str,
+        pattern: str = '*.exr',
+        max_workers: int | None = None) -> dict[str, list[ExrHeader]]:
+    """Read the headers of all matching files of a directory in threads
+
+    Files which are not valid exr files are skipped."""
+    paths = sorted(
+        os.path.join(directory, f) for f in os.listdir(directory)
+        if fnmatch.fnmatch(f, pattern))
+
+    def read(path):
+        try:
+            return read_headers(path)
+        except (OSError, ExrError):
+            return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(read, paths)
+        return {
+            path: headers for path, headers in zip(paths, results)
+            if headers is not None}
@@ -1,3 +1,4 @@
+from typing import Any, Iterable
 import nuke
 from nuke import Knob
 from .typing import Node
@@ -33,7 +34,47 @@ def create_knob(
     return knob
 
 
-def get_knob_value(node: Node, name: str) -> Node:
-    if name not in node.knobs():
+def get_knob_value(node: Node, name: str) -> Any:
+    knob = node.knob(name)
+    if knob is None:
         return
-    return node[name].value()
+    return knob.value()
+
+
+def get_knob_values(
+        nodes: list[Node], names: list[str]) -> dict[str, list]:
+    """Read knobs of many nodes, return a column of values per knob name
+
+    Columns follow the order of nodes, None is used for missing knobs."""
+    columns = {name: [] for name in names}
+    for node in nodes:
+        for name in names:
+            knob = node.knob(name)
+            columns[name].append(None if knob is None else knob.value())
+    return columns
+
+
+def set_knob_values(
+        values: Iterable[tuple[Node, str, Any]],
+        undo_name: str | None = None) -> int:
+    """Set (node, knob name, value) only where the value differs
+
+    Missing knobs are skipped. With undo_name, all writes are grouped in a
+    single undo step, which is not created if nothing is written. Return
+    the number of knobs written."""
+    written = 0
+    undo = None
+    try:
+        for node, name, value in values:
+            knob = node.knob(name)
+            if knob is None or knob.value() == value:
+                continue
+            if undo_name is not None and undo is None:
+                undo = nuke.Undo()
+                undo.begin(undo_name)
+            knob.setValue(value)
+            written += 1
+    finally:
+        if undo is not None:
+            undo.end()
+    return written
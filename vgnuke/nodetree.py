@@ -1,7 +1,11 @@
-import copy
+from array import array
+from collections import deque
+from typing import Callable, Iterable, Iterator
 import nuke
 from .typing import Node
 
+GROUP_CLASSES = ('Group', 'LiveGroup')
+
 
 def get_grid_size() -> None:
     prefs = nuke.toNode('preferences')
@@ -10,24 +14,84 @@ def get_grid_size() -> None:
     return width, height
 
 
-def get_parent_nodes(node: Node) -> None:
-    history = [node.input(i) for i in range(node.inputs()) if node.input(i)]
-    parents = []
-    for n in history:
-        if n in parents:
-            continue
-        parents.extend(get_parent_nodes(n))
-    return list(set(history + parents))
+def get_input_nodes(node: Node) -> list[Node]:
+    inputs = (node.input(i) for i in range(node.inputs()))
+    return [n for n in inputs if n is not None]
+
+
+def iter_parent_nodes(
+        node: Node, max_depth: int | None = None) -> Iterator[Node]:
+    """Yield upstream nodes breadth first, each node only once"""
+    return _iter_graph(node, get_input_nodes, max_depth)
+
 
+def iter_dependent_nodes(
+        node: Node, max_depth: int | None = None) -> Iterator[Node]:
+    """Yield downstream nodes breadth first, each node only once"""
+    return _iter_graph(node, lambda n: n.dependent(), max_depth)
 
-def get_dependent_nodes(node: Node) -> None:
-    history = copy.copy(node.dependent())
-    children = []
-    for n in history:
-        if n in children:
+
+def _iter_graph(
+        node: Node,
+        get_next_nodes: Callable,
+        max_depth: int | None = None) -> Iterator[Node]:
+    visited = {node}
+    queue = deque([(node, 0)])
+    while queue:
+        current, depth = queue.popleft()
+        if max_depth is not None and depth >= max_depth:
             continue
-        children.extend(get_dependent_nodes(n))
-    return list(set(history + children))
+        for n in get_next_nodes(current):
+            if n in visited:
+                continue
+            visited.add(n)
+            yield n
+            queue.append((n, depth + 1))
+
+
+def get_parent_nodes(
+        node: Node,
+        max_depth: int | None = None,
+        cache: dict | None = None,
+        snapshot: 'GraphSnapshot | None' = None) -> list[Node]:
+    """Return all upstream nodes
+
+    A cache dict can be shared between calls made on an unchanged node
+    tree, the returned list is then shared too and must not be modified."""
+    iter_nodes = (
+        iter_parent_nodes if snapshot is None else snapshot.iter_ancestors)
+    return _get_cached('parents', iter_nodes, node, max_depth, cache)
+
+
+def get_dependent_nodes(
+        node: Node,
+        max_depth: int | None = None,
+        cache: dict | None = None,
+        snapshot: 'GraphSnapshot | None' = None) -> list[Node]:
+    """Return all downstream nodes, see get_parent_nodes() for the cache
+
+    With a snapshot, only input connections are followed, not expression
+    links."""
+    iter_nodes = (
+        iter_dependent_nodes if snapshot is None
+        else snapshot.iter_descendants)
+    return _get_cached('dependents', iter_nodes, node, max_depth, cache)
+
+
+def _get_cached(
+        kind: str,
+        iter_nodes: Callable,
+        node: Node,
+        max_depth: int | None,
+        cache: dict | None) -> list[Node]:
+    if cache is None:
+        return list(iter_nodes(node, max_depth))
+    key = (kind, node, max_depth)
+    nodes = cache.get(key)
+    if nodes is None:
+        nodes = list(iter_nodes(node, max_depth))
+        cache[key] = nodes
+    return nodes
 
 
 def find_nodes(
@@ -51,22 +115,220 @@ def get_input_connection(group, name):
             return group.input(int(node['number'].value()))
 
 
+def iter_instances(
+        node_class: str | Iterable[str] | None = None,
+        group: Node | None = None,
+        exclude_class: str | Iterable[str] | None = None,
+        recurse_gizmos: bool = False,
+        prune: Callable[[Node], bool] | None = None) -> Iterator[Node]:
+    """Yield nodes recursively in groups, a group is yielded before its
+    content
+
+    Groups and LiveGroups are always entered, gizmos only if recurse_gizmos
+    is set. The content of a group is skipped when prune(group) returns
+    True.
+    """
+    node_classes = _as_set(node_class)
+    exclude_classes = _as_set(exclude_class)
+    stack = [iter(
+        group.nodes() if group else nuke.allNodes(recurseGroups=False))]
+    while stack:
+        node = next(stack[-1], None)
+        if node is None:
+            stack.pop()
+            continue
+        cls = node.Class()
+        if ((node_classes is None or cls in node_classes)
+                and (exclude_classes is None or cls not in exclude_classes)):
+            yield node
+        is_group = cls in GROUP_CLASSES or (
+            recurse_gizmos and isinstance(node, nuke.Gizmo))
+        if is_group and (prune is None or not prune(node)):
+            stack.append(iter(node.nodes()))
+
+
+def _as_set(value: str | Iterable[str] | None) -> set[str] | None:
+    if value is None:
+        return
+    if isinstance(value, str):
+        return {value}
+    return set(value)
+
+
 def get_all_instances(
-        node_class: str | None = None,
+        node_class: str | Iterable[str] | None = None,
         group: nuke.Node | None = None,
-        exclude_class: str | None = None):
-    nodes = []
-    group_nodes = (
-        group.nodes() if group else nuke.allNodes(recurseGroups=False))
-    for node in group_nodes:
-        cls = node.Class()
-        is_included = (
-            (node_class is None or cls == node_class) and
-            (exclude_class is None or cls != exclude_class))
-        if is_included:
-            nodes.append(node)
-        if cls == 'Group':
-            with node:
-                nodes.extend(get_all_instances(
-                    node_class, node, exclude_class))
-    return nodes
+        exclude_class: str | Iterable[str] | None = None,
+        snapshot: 'GraphSnapshot | None' = None) -> list[Node]:
+    if snapshot is not None:
+        return snapshot.get_nodes(node_class, group, exclude_class)
+    return list(iter_instances(node_class, group, exclude_class))
+
+
+class GraphSnapshot:
+    """Capture of the node tree in compact arrays
+
+    Nodes are numbered in depth first order so the nodes of a group are
+    the contiguous range following it. Classes are interned to small ints,
+    input and output connections are stored in CSR arrays (offsets and
+    indices, -1 for a disconnected input). Queries then run without calling
+    the Nuke API again, the snapshot must be captured again after the node
+    tree is edited.
+    """
+
+    def __init__(self, group: Node | None = None):
+        self.nodes = []
+        self.ids = {}
+        self.class_names = []
+        self.class_ids = {}
+        self.classes = array('H')
+        self.xpos = array('i')
+        self.ypos = array('i')
+        self.parents = array('i')  # Parent group id, -1 for top level
+        self.ends = array('i')  # End of the node range of groups
+        self.input_offsets = array('i', [0])
+        self.input_indices = array('i')
+        self.output_offsets = array('i')
+        self.output_indices = array('i')
+        self.group = group or nuke.root()
+        self.capture(self.group)
+
+    def capture(self, group: Node):
+        stack = [(-1, iter(group.nodes()))]
+        while stack:
+            parent_id, nodes = stack[-1]
+            node = next(nodes, None)
+            if node is None:
+                stack.pop()
+                if parent_id != -1:
+                    self.ends[parent_id] = len(self.nodes)
+                continue
+            node_id = len(self.nodes)
+            node_class = node.Class()
+            class_id = self.class_ids.get(node_class)
+            if class_id is None:
+                class_id = len(self.class_names)
+                self.class_ids[node_class] = class_id
+                self.class_names.append(node_class)
+            self.nodes.append(node)
+            self.ids[node] = node_id
+            self.classes.append(class_id)
+            self.xpos.append(node.xpos())
+            self.ypos.append(node.ypos())
+            self.parents.append(parent_id)
+            self.ends.append(node_id + 1)
+            if node_class in GROUP_CLASSES:
+                stack.append((node_id, iter(node.nodes())))
+
+        # Connections
+        ids = self.ids
+        output_counts = [0] * len(self.nodes)
+        for node in self.nodes:
+            for i in range(node.inputs()):
+                input_id = ids.get(node.input(i), -1)
+                self.input_indices.append(input_id)
+                if input_id != -1:
+                    output_counts[input_id] += 1
+            self.input_offsets.append(len(self.input_indices))
+        offset = 0
+        for count in output_counts:
+            self.output_offsets.append(offset)
+            offset += count
+        self.output_offsets.append(offset)
+        self.output_indices = array('i', [0] * offset)
+        fill = array('i', self.output_offsets[:-1])
+        for node_id in range(len(self.nodes)):
+            for input_id in self.get_input_ids(node_id):
+                if input_id != -1:
+                    self.output_indices[fill[input_id]] = node_id
+                    fill[input_id] += 1
+
+    def get_input_ids(self, node_id: int) -> array:
+        return self.input_indices[
+            self.input_offsets[node_id]:self.input_offsets[node_id + 1]]
+
+    def get_output_ids(self, node_id: int) -> array:
+        return self.output_indices[
+            self.output_offsets[node_id]:self.output_offsets[node_id + 1]]
+
+    def input(self, node: Node, index: int) -> Node | None:
+        input_ids = self.get_input_ids(self.ids[node])
+        if index < len(input_ids) and input_ids[index] != -1:
+            return self.nodes[input_ids[index]]
+
+    def _walk(
+            self,
+            node: Node,
+            get_next_ids: Callable,
+            max_depth: int | None = None) -> Iterator[Node]:
+        start = self.ids[node]
+        visited = bytearray(len(self.nodes))
+        visited[start] = 1
+        queue = deque([(start, 0)])
+        while queue:
+            node_id, depth = queue.popleft()
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for next_id in get_next_ids(node_id):
+                if next_id == -1 or visited[next_id]:
+                    continue
+                visited[next_id] = 1
+                yield self.nodes[next_id]
+                queue.append((next_id, depth + 1))
+
+    def iter_ancestors(
+            self, node: Node, max_depth: int | None = None) -> Iterator[Node]:
+        return self._walk(node, self.get_input_ids, max_depth)
+
+    def iter_descendants(
+            self, node: Node, max_depth: int | None = None) -> Iterator[Node]:
+        return self._walk(node, self.get_output_ids, max_depth)
+
+    def get_nodes(
+            self,
+            node_class: str | Iterable[str] | None = None,
+            group: Node | None = None,
+            exclude_class: str | Iterable[str] | None = None) -> list[Node]:
+        """Return nodes of the given classes, recursively inside group
+
+        Groups which were not captured have no nodes."""
+        if group is None or group == self.group:
+            start, end = 0, len(self.nodes)
+        elif group in self.ids:
+            group_id = self.ids[group]
+            start, end = group_id + 1, self.ends[group_id]
+        else:
+            return []
+        if node_class is None and exclude_class is None:
+            return self.nodes[start:end]
+        class_ids = self.get_class_ids(node_class)
+        exclude_class_ids = self.get_class_ids(exclude_class) or set()
+        classes = self.classes
+        return [
+            self.nodes[i] for i in range(start, end)
+            if (class_ids is None or classes[i] in class_ids)
+            and classes[i] not in exclude_class_ids]
+
+    def get_class_ids(
+            self, node_class: str | Iterable[str] | None) -> set[int] | None:
+        node_classes = _as_set(node_class)
+        if node_classes is None:
+            return
+        return {
+            self.class_ids[c] for c in node_classes if c in self.class_ids}
+
+    def get_topological_order(self) -> list[Node]:
+        """Return nodes sorted with inputs before the nodes using them"""
+        input_counts = [
+            sum(1 for i in self.get_input_ids(node_id) if i != -1)
+            for node_id in range(len(self.nodes))]
+        queue = deque(i for i, count in enumerate(input_counts) if not count)
+        order = []
+        while queue:
+            node_id = queue.popleft()
+            order.append(self.nodes[node_id])
+            for output_id in self.get_output_ids(node_id):
+                input_counts[output_id] -= 1
+                if not input_counts[output_id]:
+                    queue.append(output_id)
+        return order
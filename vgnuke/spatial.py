@@ -0,0 +1,64 @@
+"""Spatial lookup of node positions
+
+This module doesn't depend on nuke so it can be used on node records read
+outside of a Nuke session.
+"""
+
+from typing import Any, Iterable
+
+GRID_CELL_SIZE = 256
+# NOTE: Not perfect, node size can be different if label or other setting is
+# changed and makes the node bigger
+DEFAULT_NODE_SIZE = (80, 18)
+
+
+class NodeGrid:
+    """Uniform grid bucketing items by their top left corner
+
+    Items are (x, y, width, height, item) tuples. A rectangle query only
+    visits the cells overlapping the rectangle instead of every item.
+    """
+
+    __slots__ = ('cell_size', 'cells')
+
+    def __init__(
+            self,
+            entries: Iterable[tuple[float, float, float, float, Any]] = (),
+            cell_size: int = GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        for entry in entries:
+            self.add(*entry)
+
+    def add(self, x: float, y: float, width: float, height: float, item):
+        key = (int(x // self.cell_size), int(y // self.cell_size))
+        self.cells.setdefault(key, []).append((x, y, width, height, item))
+
+    def query(
+            self,
+            left: float,
+            top: float,
+            right: float,
+            bottom: float) -> list:
+        """Return items fully inside the given rectangle (borders excluded)"""
+        size = self.cell_size
+        min_cx, max_cx = int(left // size), int(right // size)
+        min_cy, max_cy = int(top // size), int(bottom // size)
+        if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) > len(self.cells):
+            # Rectangle is bigger than the populated area, visiting existing
+            # cells is cheaper than visiting empty ones.
+            buckets = [
+                bucket for (cx, cy), bucket in self.cells.items()
+                if min_cx <= cx <= max_cx and min_cy <= cy <= max_cy]
+        else:
+            buckets = [
+                self.cells.get((cx, cy), ())
+                for cx in range(min_cx, max_cx + 1)
+                for cy in range(min_cy, max_cy + 1)]
+        items = []
+        for bucket in buckets:
+            for x, y, width, height, item in bucket:
+                if (x > left and x + width < right
+                        and y > top and y + height < bottom):
+                    items.append(item)
+        return items